@@ -1,7 +1,10 @@
 
 import google.generativeai as genai
 import json
-from foodiespot_db import recommend_restaurant, make_reservation, modify_reservation, cancel_reservation, get_reservation_details, get_connection, execute_sql_query
+from foodiespot_db import recommend_restaurant, make_reservation, modify_reservation, cancel_reservation, get_reservation_details, list_customer_reservations, get_connection, execute_sql_query
+from foodiespot_llm import generate_content, llm_available, LLMUnavailableError
+from foodiespot_queue import booking_mode, enqueue_reservation
+from foodiespot_results import MAX_RESULT_ROWS, limit_query, numeric_columns, summary_query, encode_results
 import streamlit as st
 from datetime import date, timedelta,datetime
 
@@ -13,7 +16,7 @@ GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
 genai.configure(api_key=GOOGLE_API_KEY)
 model = genai.GenerativeModel('gemini-1.5-flash-8b')
 
-unction_descriptions = [
+function_descriptions = [
     {
         "name": "make_reservation",
         "description": "Makes a restaurant reservation.",
@@ -65,6 +68,19 @@ unction_descriptions = [
             "required": ["reservation_id"],
         },
     },
+    {
+        "name": "list_my_reservations",
+        "description": "Lists a customer's reservations by name, for users who do not know their reservation ID.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "customer_name": {"type": "string", "description": "The name the reservations were made under."},
+                "when": {"type": "string", "enum": ["upcoming", "past"], "description": "Whether to list upcoming or past reservations. Defaults to upcoming."},
+                "cursor": {"type": "string", "description": "The page cursor from a previous listing, to show the next page."},
+            },
+            "required": ["customer_name"],
+        },
+    },
     {
         "name": "execute_sql_query",
         "description": "Executes a custom SQL query against the database.",
@@ -78,6 +94,9 @@ unction_descriptions = [
     },
 ]
 
+# Built once so identical tool-calling prompts share a gateway key
+reservation_tools = [genai.types.Tool(function_declarations=function_descriptions)]
+
 def resolve_date(date_str):
     """Resolves date references like 'today', 'tomorrow', or 'DD-MM-YYYY'."""
     today = date.today()
@@ -119,40 +138,44 @@ def determine_intent(user_input):
         return "MODIFY_RESERVATION"
     elif any(word in user_input_lower for word in ["cancel", "delete"]):
         return "CANCEL_RESERVATION"
-    elif any(word in user_input_lower for word in ["show", "view", "get", "details", "find"]) and "reservation" in user_input_lower:
+    elif any(word in user_input_lower for word in ["show", "view", "get", "details", "find", "list", "my"]) and "reservation" in user_input_lower:
         return "GET_RESERVATION_DETAILS"
     elif any(word in user_input_lower for word in ["how many", "which", "list", "show", "what", "where", "when"]):
         return "DATABASE_QUERY"
     else:
         return "OTHER"
 
+def build_recommendation_query(user_question):
+    """Builds a recommendation query from the cuisine and rating mentioned in the question, without the LLM."""
+    # Extract cuisine type and rating if mentioned
+    cuisine_types = ["italian", "mexican", "chinese", "indian", "japanese", "american", "french", "thai", "greek", "spanish"]
+    cuisine_type = None
+    for cuisine in cuisine_types:
+        if cuisine in user_question.lower():
+            cuisine_type = cuisine.capitalize()
+            break
+
+    # Check for rating requirements
+    rating_match = re.search(r'rating\s*(of|above|over)?\s*([0-9.]+)', user_question.lower())
+    rating_threshold = None
+    if rating_match:
+        rating_threshold = float(rating_match.group(2))
+
+    # Construct appropriate SQL query based on extracted parameters
+    if cuisine_type and rating_threshold:
+        return f"SELECT name, cuisine, rating, address FROM restaurants WHERE cuisine = '{cuisine_type}' AND rating >= {rating_threshold} ORDER BY rating DESC"
+    elif cuisine_type:
+        return f"SELECT name, cuisine, rating, address FROM restaurants WHERE cuisine = '{cuisine_type}' ORDER BY rating DESC"
+    elif rating_threshold:
+        return f"SELECT name, cuisine, rating, address FROM restaurants WHERE rating >= {rating_threshold} ORDER BY rating DESC"
+    else:
+        return "SELECT name, cuisine, rating, address FROM restaurants ORDER BY rating DESC LIMIT 5"
+
 def generate_sql_query(user_question):
     """Generates a SQL query from a natural language question."""
     # For recommendation queries, enhance the query generation with specific structure
     if "recommend" in user_question.lower() or "suggestion" in user_question.lower():
-        # Extract cuisine type and rating if mentioned
-        cuisine_types = ["italian", "mexican", "chinese", "indian", "japanese", "american", "french", "thai", "greek", "spanish"]
-        cuisine_type = None
-        for cuisine in cuisine_types:
-            if cuisine in user_question.lower():
-                cuisine_type = cuisine.capitalize()
-                break
-        
-        # Check for rating requirements
-        rating_match = re.search(r'rating\s*(of|above|over)?\s*([0-9.]+)', user_question.lower())
-        rating_threshold = None
-        if rating_match:
-            rating_threshold = float(rating_match.group(2))
-        
-        # Construct appropriate SQL query based on extracted parameters
-        if cuisine_type and rating_threshold:
-            return f"SELECT name, cuisine, rating, address FROM restaurants WHERE cuisine = '{cuisine_type}' AND rating >= {rating_threshold} ORDER BY rating DESC"
-        elif cuisine_type:
-            return f"SELECT name, cuisine, rating, address FROM restaurants WHERE cuisine = '{cuisine_type}' ORDER BY rating DESC"
-        elif rating_threshold:
-            return f"SELECT name, cuisine, rating, address FROM restaurants WHERE rating >= {rating_threshold} ORDER BY rating DESC"
-        else:
-            return "SELECT name, cuisine, rating, address FROM restaurants ORDER BY rating DESC LIMIT 5"
+        return build_recommendation_query(user_question)
     
     # For general queries, use the LLM
     prompt = f"""
@@ -167,7 +190,7 @@ def generate_sql_query(user_question):
     Make sure it is a SELECT query only, no modification queries allowed.
     """
     
-    response = model.generate_content(prompt)
+    response = generate_content(model, prompt, label="sql")
     if response.text:
         # Extract SQL query, clean up any formatting
         sql_query = response.text.strip()
@@ -194,6 +217,35 @@ def is_safe_query(query):
         
     return True
 
+def fetch_prompt_results(sql_query, user_input):
+    """Runs a capped query and encodes it for an interpretation prompt; returns (result_str, error), with result_str None if no rows."""
+    results = execute_sql_query(limit_query(sql_query), include_columns=True)
+    if not isinstance(results, tuple):
+        return None, results
+    columns, rows = results
+    if not rows:
+        return None, None
+
+    total_rows, aggregates, total_is_lower_bound = None, None, False
+    if len(rows) > MAX_RESULT_ROWS:
+        # The cap cut the result short, so count and aggregate the full result in SQL
+        fetched = len(rows)
+        rows = rows[:MAX_RESULT_ROWS]
+        numeric = numeric_columns(columns, rows)
+        summary = execute_sql_query(summary_query(sql_query, numeric))
+        if isinstance(summary, list) and summary:
+            total_rows = summary[0][0]
+            aggregates = {column: tuple(summary[0][1 + 3 * i:4 + 3 * i]) for i, column in enumerate(numeric)}
+        else:
+            # Without the count all we know is that the capped query returned its extra row
+            print(f"Result summary query failed: {summary}")
+            total_rows, total_is_lower_bound = fetched, True
+
+    result_str, info = encode_results(columns, rows, user_input, total_rows=total_rows, aggregates=aggregates,
+                                      total_is_lower_bound=total_is_lower_bound)
+    print(f"Interpretation prompt: {info['rows_shown']}/{'>=' if total_is_lower_bound else ''}{info['rows_total']} rows, ~{info['prompt_tokens']} tokens (tuple repr: ~{info['tuple_repr_tokens']})")
+    return result_str, None
+
 def process_general_query(user_input):
     """Process a general query about restaurants or reservations, including recommendations."""
     # Determine if this is a recommendation request based on keywords
@@ -203,21 +255,19 @@ def process_general_query(user_input):
     sql_query = generate_sql_query(user_input)
     
     if sql_query and is_safe_query(sql_query):
-        results = execute_sql_query(sql_query)
+        result_str, error = fetch_prompt_results(sql_query, user_input)
         
-        if isinstance(results, list):
-            if not results:
+        if not error:
+            if result_str is None:
                 return "I don't have any restaurants that match your criteria at the moment."
             
             # Generate a human-readable response using the model
-            result_str = "\n".join([str(row) for row in results])
-            
             # Use different prompt for recommendations vs. general queries
             if is_recommendation:
                 interpretation_prompt = f"""
                 The user asked for a recommendation: "{user_input}"
                 
-                The database query returned these results:
+                The database query returned these results (CSV with a header row; lines starting with # are notes):
                 {result_str}
                 
                 Please format these as restaurant recommendations in a conversational style. 
@@ -230,7 +280,7 @@ def process_general_query(user_input):
                 interpretation_prompt = f"""
                 The user asked: "{user_input}"
                 
-                The database query returned these results:
+                The database query returned these results (CSV with a header row; lines starting with # are notes):
                 {result_str}
                 
                 Format these results in a conversational, helpful way.
@@ -238,7 +288,7 @@ def process_general_query(user_input):
                 DO NOT ask any follow-up questions.
                 """
             
-            interpretation = model.generate_content(interpretation_prompt)
+            interpretation = generate_content(model, interpretation_prompt, label="interpretation")
             return interpretation.text
         else:
             return "I couldn't find any restaurants matching your criteria at the moment."
@@ -246,15 +296,14 @@ def process_general_query(user_input):
         # Fall back to a default response for recommendations
         if is_recommendation:
             default_query = "SELECT name, cuisine, rating, address FROM restaurants ORDER BY rating DESC LIMIT 5"
-            results = execute_sql_query(default_query)
+            result_str, error = fetch_prompt_results(default_query, user_input)
             
-            if isinstance(results, list) and results:
-                result_str = "\n".join([str(row) for row in results])
+            if result_str:
                 
                 interpretation_prompt = f"""
                 The user asked for a recommendation: "{user_input}"
                 
-                Since I couldn't create a specific query, here are our top-rated restaurants:
+                Since I couldn't create a specific query, here are our top-rated restaurants (CSV with a header row):
                 {result_str}
                 
                 Please format these as restaurant recommendations in a conversational style.
@@ -263,12 +312,44 @@ def process_general_query(user_input):
                 Just provide the recommendations directly.
                 """
                 
-                interpretation = model.generate_content(interpretation_prompt)
+                interpretation = generate_content(model, interpretation_prompt, label="interpretation")
                 return interpretation.text
         
         return None
 
+def degraded_response(user_input):
+    """Answers without the LLM using keyword routing and templated replies, for when the model is unavailable."""
+    intent = determine_intent(user_input)
+    reservation_id_match = re.search(r'\b(\d{5})\b', user_input)
+
+    if intent == "RECOMMENDATION":
+        results = execute_sql_query(build_recommendation_query(user_input))
+        if isinstance(results, list) and results:
+            recommendations = "\n".join([f"- **{name}**: {cuisine}, Rating: {rating}, Address: {address}" for name, cuisine, rating, address in results])
+            return f"Here are some restaurants you might enjoy:\n{recommendations}"
+        return "I'm sorry, I couldn't find any restaurants matching your criteria at the moment."
+
+    if intent == "GET_RESERVATION_DETAILS" and reservation_id_match:
+        return get_reservation_details(int(reservation_id_match.group(1)))
+
+    if intent == "GET_RESERVATION_DETAILS":
+        return "Please include your 5-digit reservation ID and I'll look it up right away."
+
+    return ("Our assistant is running in quick mode right now, so I can only recommend restaurants "
+            "or show reservation details by reservation ID. "
+            "Please try booking, changing or cancelling a reservation again in a few minutes.")
+
 def run_agent(user_input, chat_history):
+    # While the circuit breaker is open, skip the LLM entirely to keep response times bounded
+    if not llm_available():
+        return degraded_response(user_input)
+    try:
+        return _run_agent(user_input, chat_history)
+    except LLMUnavailableError as e:
+        print(f"LLM unavailable, answering in degraded mode: {e}")
+        return degraded_response(user_input)
+
+def _run_agent(user_input, chat_history):
     # Determine user intent directly based on input text
     intent = determine_intent(user_input)
     
@@ -306,6 +387,7 @@ Instructions:
 10. After a successful tool call, return the reservation id to the user along with a friendly confirmation message.
 11. When handling dates, confirm the date and resolve references like 'today' or 'tomorrow' to an actual 'DD-MM-YYYY' date before calling a tool.
 12. NOTE: Do NOT handle restaurant recommendations yourself - these are processed separately.
+13. If the user wants to see their reservations but does not know the reservation ID, call the `list_my_reservations` tool with their name. To show more, call it again with the cursor from the previous listing.
 
 Current Conversation:
 {chat_history}
@@ -314,9 +396,11 @@ User: {user_input}
 Agent:
 """
 
-    response = model.generate_content(
+    response = generate_content(
+        model,
         prompt,
-        tools=[genai.types.Tool(function_declarations=function_descriptions)]
+        label="agent",
+        tools=reservation_tools
     )
 
     if response.candidates and response.candidates[0].content.parts:
@@ -338,6 +422,9 @@ Agent:
                         else:
                             return "Invalid date format. Please use 'DD-MM-YYYY', 'today', or 'tomorrow'."
                     
+                    # In queued mode the user gets a pending ticket and is notified when it resolves
+                    if booking_mode() == "queued":
+                        return enqueue_reservation(**arguments)
                     result = make_reservation(**arguments)
                     if isinstance(result, dict) and 'error' not in result:
                         confirmation_message = f"Reservation confirmed! Your reservation ID is {result['reservation_id']}"
@@ -364,6 +451,19 @@ Agent:
                         arguments["reservation_id"] = int(arguments["reservation_id"])
                     result = get_reservation_details(**arguments)
                     return result
+                elif function_name == "list_my_reservations":
+                    result = list_customer_reservations(**arguments)
+                    if 'error' in result:
+                        return result
+                    if not result["reservations"]:
+                        return f"I couldn't find any {arguments.get('when', 'upcoming')} reservations under the name {arguments['customer_name']}."
+                    formatted_results = "\n".join([
+                        f"- Reservation {r['reservation_id']}: {r['restaurant_name']} on {r['date']} at {r['time']} for {r['party_size']}"
+                        for r in result["reservations"]
+                    ])
+                    if result["next_cursor"]:
+                        formatted_results += f"\n\nThere are more reservations. Ask to see more (cursor: {result['next_cursor']})."
+                    return formatted_results
                 elif function_name == "execute_sql_query":
                     query = arguments["query"]
                     if is_safe_query(query):
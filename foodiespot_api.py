@@ -0,0 +1,334 @@
+import argparse
+import json
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import psycopg2
+import streamlit as st
+
+from foodiespot_agent import run_agent
+from foodiespot_db import (get_connection, ensure_reservation_indexes, make_reservation, modify_reservation,
+                           cancel_reservation, get_reservation_details, list_customer_reservations,
+                           db_session, get_replica_stats)
+from foodiespot_llm import get_llm_stats
+from foodiespot_queue import booking_mode, ensure_booking_queue, start_booking_workers, enqueue_reservation, get_booking_status
+
+# Headless HTTP/JSON service for partners and load-balanced deployments. Each
+# process serves requests from a fixed worker pool and shares one DB pool and
+# one model client. Chat history lives in the chat_sessions table, so any
+# instance behind the load balancer can serve any session.
+
+API_WORKERS = int(st.secrets.get("API_WORKERS", 16))
+SESSION_TTL_HOURS = int(st.secrets.get("API_SESSION_TTL_HOURS", 24))
+MAX_BODY_BYTES = 64 * 1024
+
+
+def ensure_chat_sessions():
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                session_id VARCHAR PRIMARY KEY,
+                chat_history TEXT NOT NULL DEFAULT '',
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while creating chat sessions: {e}"
+    finally:
+        conn.close()
+
+
+def load_chat_history(session_id):
+    conn = get_connection()
+    if conn is None:
+        return None
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT chat_history FROM chat_sessions WHERE session_id = %s", (session_id,))
+        row = cursor.fetchone()
+        return row[0] if row else ""
+    except psycopg2.Error as e:
+        print(f"Database error while loading chat session: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def save_chat_history(session_id, chat_history):
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            INSERT INTO chat_sessions (session_id, chat_history, updated_at) VALUES (%s, %s, now())
+            ON CONFLICT (session_id) DO UPDATE SET chat_history = EXCLUDED.chat_history, updated_at = now()
+        """, (session_id, chat_history))
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while saving chat session: {e}"
+    finally:
+        conn.close()
+
+
+def purge_chat_sessions(max_age_hours=SESSION_TTL_HOURS):
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("DELETE FROM chat_sessions WHERE updated_at < now() - %s * interval '1 hour'", (max_age_hours,))
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while purging chat sessions: {e}"
+    finally:
+        conn.close()
+
+
+def _status_for(result):
+    if isinstance(result, dict) and "error" in result:
+        error = result["error"].lower()
+        if "connection failed" in error:
+            return 503
+        if "not found" in error:
+            return 404
+        return 400
+    return 200
+
+
+def _type_error(body, expected):
+    """Returns an error payload for the first field of body whose value is not of the expected type."""
+    for field, kind in expected.items():
+        value = body.get(field)
+        if field in body and (not isinstance(value, kind) or isinstance(value, bool)):
+            return {"error": f"{field} must be {'an integer' if kind is int else 'a string'}."}
+    return None
+
+
+def handle_chat(match, query, body):
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return 400, {"error": "message is required."}
+    session_id = body.get("session_id") or uuid.uuid4().hex
+
+    chat_history = load_chat_history(session_id)
+    if chat_history is None:
+        return 503, {"error": "Could not load the chat session."}
+
+    with db_session(session_id):
+        response = run_agent(message, chat_history)
+    chat_history += f"User: {message}\nAgent: {response}\n"
+    error = save_chat_history(session_id, chat_history)
+    if error:
+        print(error)
+    return 200, {"session_id": session_id, "response": response}
+
+
+def handle_make_reservation(match, query, body):
+    fields = ("restaurant_name", "date", "time", "party_size", "customer_name")
+    missing = [field for field in fields if field not in body]
+    if missing:
+        return 400, {"error": f"Missing fields: {', '.join(missing)}"}
+    error = _type_error(body, {"restaurant_name": str, "date": str, "time": str, "party_size": int, "customer_name": str})
+    if error:
+        return 400, error
+    if body["party_size"] < 1:
+        return 400, {"error": "party_size must be at least 1."}
+    arguments = {field: body[field] for field in fields}
+    if booking_mode() == "queued":
+        result = enqueue_reservation(**arguments)
+        return (202 if "ticket_id" in result else _status_for(result)), result
+    result = make_reservation(**arguments)
+    return (201 if _status_for(result) == 200 else _status_for(result)), result
+
+
+def handle_get_reservation(match, query, body):
+    result = get_reservation_details(int(match.group(1)))
+    return _status_for(result), result
+
+
+def handle_modify_reservation(match, query, body):
+    error = _type_error(body, {"new_date": str, "new_time": str, "new_party_size": int})
+    if error:
+        return 400, error
+    arguments = {field: body[field] for field in ("new_date", "new_time", "new_party_size") if field in body}
+    result = modify_reservation(int(match.group(1)), **arguments)
+    return _status_for(result), result
+
+
+def handle_cancel_reservation(match, query, body):
+    result = cancel_reservation(int(match.group(1)))
+    return _status_for(result), result
+
+
+def handle_customer_reservations(match, query, body):
+    result = list_customer_reservations(
+        unquote(match.group(1)),
+        when=query.get("when", ["upcoming"])[0],
+        limit=int(query.get("limit", ["10"])[0]),
+        cursor=query.get("cursor", [None])[0],
+    )
+    return _status_for(result), result
+
+
+def handle_booking_status(match, query, body):
+    result = get_booking_status(int(match.group(1)))
+    return _status_for(result), result
+
+
+def handle_health(match, query, body):
+    return 200, {"status": "ok", "booking_mode": booking_mode(), "llm": get_llm_stats(), "replicas": get_replica_stats()}
+
+
+ROUTES = [
+    ("GET", re.compile(r"^/health$"), handle_health),
+    ("POST", re.compile(r"^/chat$"), handle_chat),
+    ("POST", re.compile(r"^/reservations$"), handle_make_reservation),
+    ("GET", re.compile(r"^/reservations/(\d+)$"), handle_get_reservation),
+    ("PATCH", re.compile(r"^/reservations/(\d+)$"), handle_modify_reservation),
+    ("DELETE", re.compile(r"^/reservations/(\d+)$"), handle_cancel_reservation),
+    ("GET", re.compile(r"^/customers/([^/]+)/reservations$"), handle_customer_reservations),
+    ("GET", re.compile(r"^/bookings/(\d+)$"), handle_booking_status),
+]
+
+
+class FoodieSpotHandler(BaseHTTPRequestHandler):
+    server_version = "FoodieSpot/1.0"
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        path_matched = False
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                return self._send_json(413, {"error": "Request body too large."})
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send_json(400, {"error": "Request body must be valid JSON."})
+            if not isinstance(body, dict):
+                return self._send_json(400, {"error": "Request body must be a JSON object."})
+
+            try:
+                # Clients send X-Session-Id so reads after their own bookings stay on the primary
+                with db_session(self.headers.get("X-Session-Id")):
+                    status, payload = handler(match, parse_qs(url.query), body)
+            except (TypeError, ValueError) as e:
+                status, payload = 400, {"error": f"Invalid request: {e}"}
+            except Exception as e:
+                print(f"Unhandled error for {method} {url.path}: {e}")
+                status, payload = 500, {"error": "Internal server error."}
+            return self._send_json(status, payload)
+
+        if path_matched:
+            return self._send_json(405, {"error": f"Method {method} not allowed."})
+        return self._send_json(404, {"error": "Not found."})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles each connection on a fixed-size thread pool."""
+
+    def __init__(self, server_address, handler_class, workers=API_WORKERS):
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+def _purge_sessions_periodically(stop_event):
+    while not stop_event.wait(3600):
+        error = purge_chat_sessions()
+        if error:
+            print(error)
+
+
+def serve(host="0.0.0.0", port=8000, workers=API_WORKERS):
+    for error in (ensure_reservation_indexes(), ensure_chat_sessions()):
+        if error:
+            print(error)
+    if booking_mode() == "queued":
+        error = ensure_booking_queue()
+        if error:
+            print(error)
+        start_booking_workers()
+
+    stop_event = threading.Event()
+    threading.Thread(target=_purge_sessions_periodically, args=(stop_event,), daemon=True).start()
+
+    server = PooledHTTPServer((host, port), FoodieSpotHandler, workers)
+    print(f"FoodieSpot API listening on {host}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodieSpot HTTP/JSON API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -1,24 +1,274 @@
 import psycopg2
+from psycopg2 import pool
 import streamlit as st
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+import itertools
 import random
+import threading
+import time
+
+# Connections come from process-wide pools shared by the Streamlit app, the API
+# server and background workers. Callers keep using conn.close(), which hands
+# the connection back to its pool instead of closing it.
+#
+# Writes always go to the primary. Read-only callers pass readonly=True and are
+# routed to a healthy read replica (DB_REPLICA_HOSTS) unless the current session
+# wrote recently, in which case they stay on the primary to read their own writes.
+DB_POOL_MAX = int(st.secrets.get("DB_POOL_MAX", 20))
+DB_POOL_WAIT_SEC = float(st.secrets.get("DB_POOL_WAIT_SEC", 10))
+DB_REPLICA_HOSTS = list(st.secrets.get("DB_REPLICA_HOSTS", []))
+DB_REPLICA_SELECTION = st.secrets.get("DB_REPLICA_SELECTION", "least_loaded")
+DB_REPLICA_MAX_LAG_SEC = float(st.secrets.get("DB_REPLICA_MAX_LAG_SEC", 5))
+DB_REPLICA_RETRY_SEC = float(st.secrets.get("DB_REPLICA_RETRY_SEC", 30))
+DB_REPLICA_LAG_CHECK_SEC = float(st.secrets.get("DB_REPLICA_LAG_CHECK_SEC", 5))
+DB_READ_YOUR_WRITES_SEC = float(st.secrets.get("DB_READ_YOUR_WRITES_SEC", 10))
+
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+class _FailoverCursor:
+    """Cursor on a replica connection that re-runs a query on the primary if the replica fails it."""
+
+    def __init__(self, pooled, cursor):
+        self._pooled = pooled
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, query, params=None):
+        try:
+            return self._cursor.execute(query, params)
+        except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
+            if not self._replica_failed(e) or not self._pooled._fail_over(e):
+                raise
+            self._cursor = self._pooled.cursor()
+            return self._cursor.execute(query, params)
+
+    def _replica_failed(self, error):
+        # Only a lost connection or a recovery conflict says the replica is at fault. A query
+        # cancelled by statement_timeout would be just as slow on the primary, so it is not retried.
+        if isinstance(error, psycopg2.extensions.QueryCanceledError):
+            return False
+        if isinstance(error, (psycopg2.InterfaceError, psycopg2.extensions.TransactionRollbackError)):
+            return True
+        return bool(self._pooled._conn.closed)
+
+class _PooledConnection:
+    """Proxies a pooled psycopg2 connection; close() returns it to the pool."""
+
+    def __init__(self, conn, server):
+        self._conn = conn
+        self._server = server
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # Settings such as autocommit belong to the underlying connection
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    @property
+    def closed(self):
+        return 1 if self._released else self._conn.closed
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        return _FailoverCursor(self, cursor) if self._server.is_replica else cursor
+
+    def _fail_over(self, error):
+        """Swaps a failed replica connection for a primary one; returns False if that is not possible."""
+        if not self._server.is_replica:
+            return False
+        replacement = _primary.acquire()
+        if replacement is None:
+            return False
+        self._server.mark_unhealthy(error)
+        # A dead or cancelled replica connection is not worth keeping in the pool
+        self._server.release(self._conn, True)
+        self._conn, self._server = replacement._conn, replacement._server
+        replacement._released = True
+        return True
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        broken = bool(self._conn.closed)
+        if not broken:
+            try:
+                self._conn.rollback()
+                self._conn.autocommit = False
+            except psycopg2.Error:
+                broken = True
+        self._server.release(self._conn, broken)
+
+class _DatabaseServer:
+    """One database server (the primary or a replica) with its own connection pool and health state."""
+
+    def __init__(self, name, host, port, is_replica=False):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.is_replica = is_replica
+        self.in_use = 0
+        self.lag = None
+        self.lag_checked_at = 0.0
+        self.unhealthy_until = 0.0
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def mark_unhealthy(self, reason):
+        print(f"Database replica {self.name} unavailable, reading from primary: {reason}")
+        self.unhealthy_until = time.monotonic() + DB_REPLICA_RETRY_SEC
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pool.ThreadedConnectionPool(
+                    1,
+                    DB_POOL_MAX,
+                    host=self.host or st.secrets["DB_HOST"],
+                    database=st.secrets["DB_NAME"],
+                    user=st.secrets["DB_USER"],
+                    password=st.secrets["DB_PASSWORD"],
+                    port=self.port or st.secrets["DB_PORT"]
+                )
+            return self._pool
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=DB_POOL_WAIT_SEC):
+            print(f"Database connection error: connection pool for {self.name} exhausted")
+            return None
+        try:
+            conn = _PooledConnection(self._get_pool().getconn(), self)
+        except psycopg2.Error as e:
+            self._slots.release()
+            if self.is_replica:
+                self.mark_unhealthy(e)
+            else:
+                print(f"Database connection error: {e}")
+            return None
+        with self._lock:
+            self.in_use += 1
+
+        if self.is_replica and time.monotonic() - self.lag_checked_at >= DB_REPLICA_LAG_CHECK_SEC:
+            try:
+                # Straight on the replica connection: a failed check must not fail over to the primary
+                cursor = conn._conn.cursor()
+                cursor.execute(REPLICA_LAG_QUERY)
+                self.lag = float(cursor.fetchone()[0])
+                self.lag_checked_at = time.monotonic()
+            except psycopg2.Error as e:
+                conn.close()
+                self.mark_unhealthy(e)
+                return None
+            if self.lag > DB_REPLICA_MAX_LAG_SEC:
+                conn.close()
+                self.mark_unhealthy(f"replication lag {self.lag:.1f}s")
+                return None
+        return conn
+
+    def release(self, conn, broken):
+        self._get_pool().putconn(conn, close=broken)
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+def _parse_host(entry):
+    host, _, port = str(entry).partition(":")
+    return host, int(port) if port else None
+
+# Host and port fall back to DB_HOST / DB_PORT when the pool is first created
+_primary = _DatabaseServer("primary", None, None)
+_replicas = [_DatabaseServer(str(entry), *_parse_host(entry), is_replica=True) for entry in DB_REPLICA_HOSTS]
+_round_robin = itertools.count()
+
+_db_session = ContextVar("db_session", default=None)
+_last_writes = {}
+_last_writes_lock = threading.Lock()
+
+def set_db_session(session_key):
+    """Tags the current context with a session so reads after its writes stay on the primary."""
+    _db_session.set(session_key)
 
-def get_connection():
+@contextmanager
+def db_session(session_key):
+    token = _db_session.set(session_key)
     try:
-        conn = psycopg2.connect(
-            host=st.secrets["DB_HOST"],
-            database=st.secrets["DB_NAME"],
-            user=st.secrets["DB_USER"],
-            password=st.secrets["DB_PASSWORD"],
-            port=st.secrets["DB_PORT"]
-        )
-        return conn
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
+        yield
+    finally:
+        _db_session.reset(token)
+
+def _mark_write():
+    session_key = _db_session.get()
+    if session_key is None:
+        return
+    now = time.monotonic()
+    with _last_writes_lock:
+        _last_writes[session_key] = now
+        if len(_last_writes) > 10000:
+            for key, written_at in list(_last_writes.items()):
+                if now - written_at > DB_READ_YOUR_WRITES_SEC:
+                    del _last_writes[key]
+
+def _wrote_recently():
+    session_key = _db_session.get()
+    if session_key is None:
+        return False
+    with _last_writes_lock:
+        written_at = _last_writes.get(session_key)
+    return written_at is not None and time.monotonic() - written_at < DB_READ_YOUR_WRITES_SEC
+
+def _pick_replica(exclude):
+    candidates = [replica for replica in _replicas if replica.healthy() and replica not in exclude]
+    if not candidates:
         return None
+    if DB_REPLICA_SELECTION == "round_robin":
+        return candidates[next(_round_robin) % len(candidates)]
+    return min(candidates, key=lambda replica: replica.in_use)
+
+def get_connection(readonly=False):
+    if readonly and _replicas and not _wrote_recently():
+        tried = []
+        while True:
+            replica = _pick_replica(tried)
+            if replica is None:
+                break
+            conn = replica.acquire()
+            if conn is not None:
+                return conn
+            tried.append(replica)
+    return _primary.acquire()
+
+def get_replica_stats():
+    """Returns health, replication lag (seconds) and connections in use for each read replica."""
+    return [
+        {
+            "name": replica.name,
+            "healthy": replica.healthy(),
+            "lag_seconds": replica.lag,
+            "in_use": replica.in_use,
+        }
+        for replica in _replicas
+    ]
 
 def recommend_restaurant(cuisine=None, party_size=None, rating=None, address=None):
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     if conn is None:
         return "Database connection failed. Please check your credentials."
     cursor = conn.cursor()
@@ -42,7 +292,6 @@ def recommend_restaurant(cuisine=None, party_size=None, rating=None, address=Non
 
         cursor.execute(query, params)
         results = cursor.fetchall()
-        conn.close()
 
         if results:
             recommendations = "\n".join([f"- **{name}**: {cuisine}, Rating: {rating}, Address: {address}" for name, cuisine, rating, address in results])
@@ -50,8 +299,9 @@ def recommend_restaurant(cuisine=None, party_size=None, rating=None, address=Non
         else:
             return "No restaurants match your criteria."
     except psycopg2.Error as e:
-        conn.close()
         return f"Database error during recommendation: {e}"
+    finally:
+        conn.close()
 
 def make_reservation(restaurant_name, date, time, party_size, customer_name):
     conn = get_connection()
@@ -64,14 +314,12 @@ def make_reservation(restaurant_name, date, time, party_size, customer_name):
         restaurant = cursor.fetchone()
 
         if not restaurant:
-            conn.close()
             return {"error": f"Restaurant '{restaurant_name}' not found."}
 
         restaurant_id, capacity, current_booking = restaurant
         print(f"Restaurant ID: {restaurant_id}, Capacity: {capacity}, Current Booking: {current_booking}")
 
         if current_booking + party_size > capacity:
-            conn.close()
             return {"error": f"Sorry, there are not enough spots available at {restaurant_name} on {date} at {time}. Would you like to check other options?"}
 
         # Generate a random 5-digit reservation ID
@@ -81,8 +329,7 @@ def make_reservation(restaurant_name, date, time, party_size, customer_name):
         try:
             date_obj = datetime.strptime(date, "%d-%m-%Y").date()
             time_obj = datetime.strptime(time, "%H:%M").time()
-        except ValueError as e:
-            conn.close()
+        except (TypeError, ValueError) as e:
             return {"error": f"Invalid date or time format: {e}"}
 
         cursor.execute(
@@ -92,9 +339,11 @@ def make_reservation(restaurant_name, date, time, party_size, customer_name):
 
         print(f"Reservation ID: {reservation_id}")
 
-        cursor.execute("UPDATE restaurants SET current_booking = current_booking + %s WHERE restaurant_id = %s", (party_size, restaurant_id))
+        # Only bookings dated today or later count, matching the nightly rollover
+        cursor.execute("UPDATE restaurants SET current_booking = current_booking + %s WHERE restaurant_id = %s AND %s >= CURRENT_DATE", (party_size, restaurant_id, date_obj))
 
         conn.commit()
+        _mark_write()
         # Fetch the reservation details
         cursor.execute("""
             SELECT r.reservation_id, res.name, r.customer_name, r.date, r.time, r.party_size
@@ -103,7 +352,6 @@ def make_reservation(restaurant_name, date, time, party_size, customer_name):
             WHERE r.reservation_id = %s
         """, (reservation_id,))
         reservation = cursor.fetchone()
-        conn.close()
 
         if reservation:
             return {
@@ -118,79 +366,93 @@ def make_reservation(restaurant_name, date, time, party_size, customer_name):
             return {"error": "Reservation not found after creation."}
     except psycopg2.Error as e:
         conn.rollback()
-        conn.close()
         print(f"Database error during reservation: {e}")
         return {"error": f"Database error during reservation: {e}"}
+    finally:
+        conn.close()
 
 
 def modify_reservation(reservation_id, new_date=None, new_time=None, new_party_size=None):
+    try:
+        date_obj = datetime.strptime(new_date, "%d-%m-%Y").date() if new_date is not None else None
+        time_obj = datetime.strptime(new_time, "%H:%M").time() if new_time is not None else None
+    except (TypeError, ValueError) as e:
+        return {"error": f"Invalid date or time format: {e}"}
+    if new_party_size is not None:
+        new_party_size = int(new_party_size)
+        if new_party_size < 1:
+            return {"error": "Party size must be at least 1."}
+
     conn = get_connection()
     if conn is None:
         return {"error": "Database connection failed. Please check your credentials."}
     cursor = conn.cursor()
 
     try:
-        cursor.execute("SELECT restaurant_id, party_size, date, time FROM reservations WHERE reservation_id = %s", (reservation_id,))
-        reservation = cursor.fetchone()
+        # Locks the reservation, then its restaurant (the same order as cancel_reservation),
+        # applies the capacity delta check and both updates in one round trip. Like the nightly
+        # rollover, current_booking only counts reservations dated today or later.
+        cursor.execute("""
+            WITH old AS (
+                SELECT reservation_id, restaurant_id,
+                       CASE WHEN date >= CURRENT_DATE THEN party_size ELSE 0 END AS counted_before,
+                       CASE WHEN COALESCE(%(new_date)s::date, date) >= CURRENT_DATE
+                            THEN COALESCE(%(new_party_size)s::integer, party_size) ELSE 0 END AS counted_after
+                FROM reservations
+                WHERE reservation_id = %(reservation_id)s
+                FOR UPDATE
+            ),
+            booking AS (
+                UPDATE restaurants res
+                SET current_booking = res.current_booking - old.counted_before + old.counted_after
+                FROM old
+                WHERE res.restaurant_id = old.restaurant_id
+                  AND (old.counted_after <= old.counted_before
+                       OR res.current_booking - old.counted_before + old.counted_after <= res.seating_capacity)
+                RETURNING res.restaurant_id, res.name
+            ),
+            updated AS (
+                UPDATE reservations r
+                SET date = COALESCE(%(new_date)s::date, r.date),
+                    time = COALESCE(%(new_time)s::time, r.time),
+                    party_size = COALESCE(%(new_party_size)s::integer, r.party_size)
+                FROM booking
+                WHERE r.reservation_id = %(reservation_id)s AND r.restaurant_id = booking.restaurant_id
+                RETURNING r.reservation_id, booking.name, r.customer_name, r.date, r.time, r.party_size
+            )
+            SELECT u.reservation_id, u.name, u.customer_name, u.date, u.time, u.party_size
+            FROM old
+            LEFT JOIN updated u ON u.reservation_id = old.reservation_id
+        """, {
+            "reservation_id": reservation_id,
+            "new_date": date_obj,
+            "new_time": time_obj,
+            "new_party_size": new_party_size,
+        })
+        updated_reservation = cursor.fetchone()
 
-        if not reservation:
-            conn.close()
+        if not updated_reservation:
+            conn.rollback()
             return {"error": "Reservation not found."}
-
-        restaurant_id, current_party_size, current_date, current_time = reservation
-
-        # Check if the restaurant has capacity for the new party size, if changed
-        if new_party_size is not None:
-            cursor.execute("SELECT seating_capacity, current_booking FROM restaurants WHERE restaurant_id = %s", (restaurant_id,))
-            capacity, current_booking_restaurant = cursor.fetchone()
-
-            # Ensure new_date and new_time are not None before using them
-            date_to_check = new_date if new_date is not None else current_date
-            time_to_check = new_time if new_time is not None else current_time
-
-            cursor.execute("SELECT SUM(party_size) FROM reservations WHERE restaurant_id = %s AND date = %s AND time = %s AND reservation_id != %s", (restaurant_id, date_to_check, time_to_check, reservation_id))
-            total_reserved = cursor.fetchone()[0] or 0
-
-            if current_booking_restaurant - current_party_size + new_party_size > capacity:
-                conn.close()
-                return {"error": "The restaurant does not have enough capacity for the new party size."}
-
-        # Update reservation details
-        cursor.execute(
-            "UPDATE reservations SET date = %s, time = %s, party_size = %s WHERE reservation_id = %s",
-            (new_date or current_date, new_time or current_time, new_party_size or current_party_size, reservation_id),
-        )
-
-        # Update restaurant booking if party size changed
-        if new_party_size is not None:
-            cursor.execute("UPDATE restaurants SET current_booking = current_booking - %s + %s WHERE restaurant_id = %s", (current_party_size, new_party_size, restaurant_id))
+        if updated_reservation[0] is None:
+            conn.rollback()
+            return {"error": "The restaurant does not have enough capacity for the new party size."}
 
         conn.commit()
-        # Fetch the updated reservation details
-        cursor.execute("""
-            SELECT r.reservation_id, res.name, r.customer_name, r.date, r.time, r.party_size
-            FROM reservations r
-            JOIN restaurants res ON r.restaurant_id = res.restaurant_id
-            WHERE r.reservation_id = %s
-        """, (reservation_id,))
-        updated_reservation = cursor.fetchone()
-        conn.close()
-
-        if updated_reservation:
-            return {
-                "reservation_id": updated_reservation[0],
-                "restaurant_name": updated_reservation[1],
-                "customer_name": updated_reservation[2],
-                "date": str(updated_reservation[3]),
-                "time": str(updated_reservation[4]),
-                "party_size": updated_reservation[5]
-            }
-        else:
-            return {"error": "Reservation details not found after modification."}
+        _mark_write()
+        return {
+            "reservation_id": updated_reservation[0],
+            "restaurant_name": updated_reservation[1],
+            "customer_name": updated_reservation[2],
+            "date": str(updated_reservation[3]),
+            "time": str(updated_reservation[4]),
+            "party_size": updated_reservation[5]
+        }
     except psycopg2.Error as e:
         conn.rollback()
-        conn.close()
         return {"error": f"Database error during modification: {e}"}
+    finally:
+        conn.close()
 
 def cancel_reservation(reservation_id):
     conn = get_connection()
@@ -199,29 +461,32 @@ def cancel_reservation(reservation_id):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("SELECT restaurant_id, party_size FROM reservations WHERE reservation_id = %s", (reservation_id,))
+        # Deleting first locks the reservation, then its restaurant, the same order as modify_reservation.
+        # A concurrent modify is waited for, and RETURNING yields the party size it committed.
+        cursor.execute("DELETE FROM reservations WHERE reservation_id = %s RETURNING restaurant_id, party_size, date >= CURRENT_DATE", (reservation_id,))
         reservation = cursor.fetchone()
 
         if not reservation:
-            conn.close()
+            conn.rollback()
             return {"error": "Reservation not found."}
 
-        restaurant_id, party_size = reservation
-
-        cursor.execute("DELETE FROM reservations WHERE reservation_id = %s", (reservation_id,))
+        restaurant_id, party_size, upcoming = reservation
 
-        cursor.execute("UPDATE restaurants SET current_booking = current_booking - %s WHERE restaurant_id = %s", (party_size, restaurant_id))
+        # Past reservations were already dropped from current_booking by the nightly rollover
+        if upcoming:
+            cursor.execute("UPDATE restaurants SET current_booking = current_booking - %s WHERE restaurant_id = %s", (party_size, restaurant_id))
 
         conn.commit()
-        conn.close()
+        _mark_write()
         return {"message": "Reservation canceled successfully."}
     except psycopg2.Error as e:
         conn.rollback()
-        conn.close()
         return {"error": f"Database error during cancellation: {e}"}
+    finally:
+        conn.close()
 
 def get_reservation_details(reservation_id):
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     if conn is None:
         return {"error": "Database connection failed. Please check your credentials."}
     cursor = conn.cursor()
@@ -235,8 +500,6 @@ def get_reservation_details(reservation_id):
         """, (reservation_id,))
         reservation = cursor.fetchone()
 
-        conn.close()
-
         if reservation:
             return {
                 "reservation_id": reservation[0],
@@ -249,11 +512,117 @@ def get_reservation_details(reservation_id):
         else:
             return {"error": "Reservation not found."}
     except psycopg2.Error as e:
-        conn.close()
         return {"error": f"Database error during reservation details retrieval: {e}"}
+    finally:
+        conn.close()
 
-def execute_sql_query(query):
+def ensure_reservation_indexes():
     conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+
+    try:
+        # CONCURRENTLY builds without blocking bookings but cannot run inside a transaction
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.oid = to_regclass('reservations_customer_date_idx')
+        """)
+        existing = cursor.fetchone()
+        if existing and existing[0]:
+            return None
+        if existing:
+            # An interrupted concurrent build leaves an invalid index behind
+            cursor.execute("DROP INDEX CONCURRENTLY reservations_customer_date_idx")
+        # Serves list_customer_reservations: equality on the customer, keyset order on the rest
+        cursor.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS reservations_customer_date_idx ON reservations (lower(customer_name), date, time, reservation_id)")
+        return None
+    except psycopg2.Error as e:
+        return f"Database error while creating reservation indexes: {e}"
+    finally:
+        conn.close()
+
+def list_customer_reservations(customer_name, when="upcoming", limit=10, cursor=None):
+    """Lists a customer's upcoming or past reservations; pass the returned next_cursor to get the next page."""
+    if when not in ("upcoming", "past"):
+        return {"error": "Please choose either upcoming or past reservations."}
+    limit = max(1, min(int(limit), 50))
+
+    after = None
+    if cursor:
+        try:
+            cursor_date, cursor_time, cursor_id = cursor.split(",")
+            after = (
+                datetime.strptime(cursor_date, "%Y-%m-%d").date(),
+                datetime.strptime(cursor_time, "%H:%M:%S").time(),
+                int(cursor_id),
+            )
+        except ValueError:
+            return {"error": "Invalid page cursor."}
+
+    conn = get_connection(readonly=True)
+    if conn is None:
+        return {"error": "Database connection failed. Please check your credentials."}
+    db_cursor = conn.cursor()
+
+    try:
+        # Upcoming bookings read forward from today, past bookings read backwards from yesterday
+        if when == "upcoming":
+            query = """
+                SELECT r.reservation_id, res.name, r.customer_name, r.date, r.time, r.party_size
+                FROM reservations r
+                JOIN restaurants res ON r.restaurant_id = res.restaurant_id
+                WHERE lower(r.customer_name) = lower(%s) AND r.date >= CURRENT_DATE
+            """
+            order = " ORDER BY r.date, r.time, r.reservation_id LIMIT %s"
+            comparison = " AND (r.date, r.time, r.reservation_id) > (%s, %s, %s)"
+        else:
+            query = """
+                SELECT r.reservation_id, res.name, r.customer_name, r.date, r.time, r.party_size
+                FROM reservations r
+                JOIN restaurants res ON r.restaurant_id = res.restaurant_id
+                WHERE lower(r.customer_name) = lower(%s) AND r.date < CURRENT_DATE
+            """
+            order = " ORDER BY r.date DESC, r.time DESC, r.reservation_id DESC LIMIT %s"
+            comparison = " AND (r.date, r.time, r.reservation_id) < (%s, %s, %s)"
+
+        params = [customer_name]
+        if after:
+            query += comparison
+            params.extend(after)
+        query += order
+        params.append(limit + 1)
+
+        db_cursor.execute(query, params)
+        rows = db_cursor.fetchall()
+
+        reservations = [
+            {
+                "reservation_id": row[0],
+                "restaurant_name": row[1],
+                "customer_name": row[2],
+                "date": str(row[3]),
+                "time": str(row[4]),
+                "party_size": row[5]
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last[3]},{last[4]},{last[0]}"
+        return {"reservations": reservations, "next_cursor": next_cursor}
+    except psycopg2.Error as e:
+        return {"error": f"Database error while listing reservations: {e}"}
+    finally:
+        conn.close()
+
+def execute_sql_query(query, include_columns=False):
+    """Runs a query and returns its rows, or (column_names, rows) when include_columns is set."""
+    conn = get_connection(readonly=True)
     if conn is None:
         return "Database connection failed. Please check your credentials."
     cursor = conn.cursor()
@@ -264,14 +633,16 @@ def execute_sql_query(query):
         # Check if this is a SELECT query that returns results
         if cursor.description is not None:
             results = cursor.fetchall()
-            conn.close()
+            columns = [column[0] for column in cursor.description]
+            if include_columns:
+                return columns, results
             return results
         else:
             # This was a non-SELECT query
             conn.rollback()  # Roll back any changes
-            conn.close()
             return "This query does not return any results or is not allowed."
     except psycopg2.Error as e:
         conn.rollback()
-        conn.close()
         return f"Database error: {e}"
+    finally:
+        conn.close()
@@ -0,0 +1,284 @@
+import random
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+from google.api_core.exceptions import DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable
+
+# Gateway for every Gemini call. Streamlit serves all sessions from one process,
+# so the state below is shared: identical prompts in flight are merged into one
+# request and a token bucket keeps us under the provider's quota. Each call also
+# runs under a deadline with jittered retries, and a circuit breaker stops
+# calling the provider while it keeps failing or answering slowly.
+
+RATE_PER_SEC = float(st.secrets.get("LLM_RATE_PER_SEC", 5))
+BURST = int(st.secrets.get("LLM_BURST", 10))
+MAX_QUEUE = int(st.secrets.get("LLM_MAX_QUEUE", 50))
+MAX_WAIT_SEC = float(st.secrets.get("LLM_MAX_WAIT_SEC", 10))
+
+CALL_DEADLINE_SEC = float(st.secrets.get("LLM_CALL_DEADLINE_SEC", 12))
+MAX_RETRIES = int(st.secrets.get("LLM_MAX_RETRIES", 2))
+RETRY_BASE_SEC = float(st.secrets.get("LLM_RETRY_BASE_SEC", 0.5))
+SLOW_CALL_SEC = float(st.secrets.get("LLM_SLOW_CALL_SEC", 6))
+BREAKER_THRESHOLD = int(st.secrets.get("LLM_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN_SEC = float(st.secrets.get("LLM_BREAKER_COOLDOWN_SEC", 30))
+
+TRANSIENT_ERRORS = (DeadlineExceeded, InternalServerError, ServiceUnavailable)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the language model cannot answer within its deadline or the circuit breaker is open."""
+
+
+class LLMBusyError(LLMUnavailableError):
+    """Raised when a call cannot be admitted by the rate limiter or the provider quota is exhausted."""
+
+
+_bucket = threading.Condition()
+_tokens = float(BURST)
+_last_refill = time.monotonic()
+_waiting = 0
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+_breaker_lock = threading.Lock()
+_breaker = {"state": "closed", "failures": 0, "opened_at": 0.0}
+
+_stats_lock = threading.Lock()
+_latencies = deque(maxlen=1000)
+_label_stats = {}
+_stats = {
+    "calls": 0,
+    "coalesced": 0,
+    "rejected": 0,
+    "quota_errors": 0,
+    "queue_depth": 0,
+    "peak_queue_depth": 0,
+    "retries": 0,
+    "timeouts": 0,
+    "slow_calls": 0,
+    "breaker_trips": 0,
+    "breaker_rejections": 0,
+}
+
+
+def _refill():
+    global _tokens, _last_refill
+    now = time.monotonic()
+    _tokens = min(BURST, _tokens + (now - _last_refill) * RATE_PER_SEC)
+    _last_refill = now
+
+
+def _acquire_token(deadline):
+    """Takes one token from the bucket, waiting in a bounded queue if none are left."""
+    global _tokens, _waiting
+    with _bucket:
+        _refill()
+        if _tokens >= 1:
+            _tokens -= 1
+            return
+
+        if _waiting >= MAX_QUEUE:
+            with _stats_lock:
+                _stats["rejected"] += 1
+            raise LLMBusyError("Too many requests are waiting for the language model.")
+
+        _waiting += 1
+        with _stats_lock:
+            _stats["queue_depth"] = _waiting
+            _stats["peak_queue_depth"] = max(_stats["peak_queue_depth"], _waiting)
+
+        deadline = min(deadline, time.monotonic() + MAX_WAIT_SEC)
+        try:
+            while True:
+                _refill()
+                if _tokens >= 1:
+                    _tokens -= 1
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with _stats_lock:
+                        _stats["rejected"] += 1
+                    raise LLMBusyError("Timed out waiting for the language model rate limit.")
+                _bucket.wait(min(remaining, (1 - _tokens) / RATE_PER_SEC))
+        finally:
+            _waiting -= 1
+            with _stats_lock:
+                _stats["queue_depth"] = _waiting
+
+
+def _breaker_allow():
+    """Raises LLMUnavailableError while the breaker is open; lets a single trial call through after the cooldown."""
+    with _breaker_lock:
+        if _breaker["state"] == "closed":
+            return
+        if _breaker["state"] == "open" and time.monotonic() - _breaker["opened_at"] >= BREAKER_COOLDOWN_SEC:
+            _breaker["state"] = "half_open"
+            return
+    with _stats_lock:
+        _stats["breaker_rejections"] += 1
+    raise LLMUnavailableError("The language model circuit breaker is open.")
+
+
+def _record_success():
+    with _breaker_lock:
+        _breaker["state"] = "closed"
+        _breaker["failures"] = 0
+
+
+def _record_failure():
+    with _breaker_lock:
+        _breaker["failures"] += 1
+        if _breaker["state"] == "half_open" or _breaker["failures"] >= BREAKER_THRESHOLD:
+            if _breaker["state"] != "open":
+                with _stats_lock:
+                    _stats["breaker_trips"] += 1
+                print(f"LLM circuit breaker opened after {_breaker['failures']} failed or slow calls")
+            _breaker["state"] = "open"
+            _breaker["opened_at"] = time.monotonic()
+
+
+def _release_trial():
+    """Re-opens the breaker if a half-open trial call never reached the provider."""
+    with _breaker_lock:
+        if _breaker["state"] == "half_open":
+            _breaker["state"] = "open"
+            _breaker["opened_at"] = time.monotonic() - BREAKER_COOLDOWN_SEC
+
+
+def llm_available():
+    """Returns False while the circuit breaker is open and still cooling down."""
+    with _breaker_lock:
+        return _breaker["state"] != "open" or time.monotonic() - _breaker["opened_at"] >= BREAKER_COOLDOWN_SEC
+
+
+def _call_model(model, prompt, kwargs):
+    deadline = time.monotonic() + CALL_DEADLINE_SEC
+    attempt = 0
+    while True:
+        _breaker_allow()
+        try:
+            _acquire_token(deadline)
+        except LLMBusyError:
+            _release_trial()
+            raise
+
+        remaining = deadline - time.monotonic()
+        call_kwargs = dict(kwargs)
+        call_kwargs["request_options"] = {**kwargs.get("request_options", {}), "timeout": max(remaining, 0.1)}
+
+        start = time.monotonic()
+        try:
+            response = model.generate_content(prompt, **call_kwargs)
+        except ResourceExhausted as e:
+            _record_failure()
+            with _stats_lock:
+                _stats["quota_errors"] += 1
+            raise LLMBusyError(f"Language model quota exhausted: {e}") from e
+        except TRANSIENT_ERRORS as e:
+            _record_failure()
+            with _stats_lock:
+                _stats["timeouts" if isinstance(e, DeadlineExceeded) else "retries"] += 1
+            attempt += 1
+            # Full jitter keeps retries from many sessions from arriving in lockstep
+            backoff = random.uniform(0, RETRY_BASE_SEC * (2 ** attempt))
+            if attempt > MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                raise LLMUnavailableError(f"Language model call failed: {e}") from e
+            time.sleep(backoff)
+            continue
+        except Exception:
+            # Errors such as InvalidArgument say nothing about provider health; end the trial without a verdict
+            _release_trial()
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with _stats_lock:
+                _stats["calls"] += 1
+                _latencies.append(elapsed)
+
+        if elapsed > SLOW_CALL_SEC:
+            with _stats_lock:
+                _stats["slow_calls"] += 1
+            _record_failure()
+        else:
+            _record_success()
+        return response
+
+
+def _record_label(label, started, response):
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    with _stats_lock:
+        entry = _label_stats.setdefault(label, {"calls": 0, "prompt_tokens": 0, "latencies": deque(maxlen=1000)})
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["latencies"].append(time.monotonic() - started)
+
+
+def generate_content(model, prompt, label="other", **kwargs):
+    """Calls model.generate_content, sharing the result with identical in-flight requests; label groups the call in get_llm_stats()."""
+    started = time.monotonic()
+    key = (id(model), prompt, repr(sorted(kwargs.items(), key=lambda item: item[0])))
+
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        leader = entry is None
+        if leader:
+            entry = {"done": threading.Event(), "response": None, "error": None}
+            _inflight[key] = entry
+
+    if not leader:
+        with _stats_lock:
+            _stats["coalesced"] += 1
+        entry["done"].wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+        _record_label(label, started, entry["response"])
+        return entry["response"]
+
+    try:
+        entry["response"] = _call_model(model, prompt, kwargs)
+        _record_label(label, started, entry["response"])
+        return entry["response"]
+    except Exception as e:
+        entry["error"] = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        entry["done"].set()
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of values using nearest-rank, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def get_llm_stats():
+    """Returns a snapshot of gateway counters, queue depth and call latency percentiles (seconds)."""
+    with _stats_lock:
+        stats = dict(_stats)
+        latencies = list(_latencies)
+        labels = {label: (entry["calls"], entry["prompt_tokens"], list(entry["latencies"])) for label, entry in _label_stats.items()}
+    stats["in_flight"] = len(_inflight)
+    with _breaker_lock:
+        stats["breaker_state"] = _breaker["state"]
+    stats["latency_p50"] = percentile(latencies, 50)
+    stats["latency_p95"] = percentile(latencies, 95)
+    stats["latency_p99"] = percentile(latencies, 99)
+    stats["labels"] = {
+        label: {
+            "calls": calls,
+            "avg_prompt_tokens": prompt_tokens / calls if calls else 0,
+            "latency_p50": percentile(label_latencies, 50),
+            "latency_p95": percentile(label_latencies, 95),
+        }
+        for label, (calls, prompt_tokens, label_latencies) in labels.items()
+    }
+    return stats
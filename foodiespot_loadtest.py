@@ -0,0 +1,278 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import foodiespot_agent
+import foodiespot_db
+import foodiespot_llm
+from foodiespot_agent import run_agent, determine_intent
+from foodiespot_llm import percentile
+from foodiespot_stress import run_modify_stress
+
+# Replays multi-turn conversations through run_agent against a local database
+# with a deterministic stand-in for genai.GenerativeModel, so load tests cost no
+# Gemini quota. Reports latency percentiles, throughput, DB round trips and LLM
+# calls per turn, broken down by intent.
+#
+#   python foodiespot_loadtest.py --users 20 --iterations 5 --llm-latency-ms 400
+#   python foodiespot_loadtest.py --conversations recorded.jsonl
+#   python foodiespot_loadtest.py --modify-stress 16
+
+_counters = threading.local()
+
+
+def _count(name):
+    setattr(_counters, name, getattr(_counters, name, 0) + 1)
+
+
+def _reset_counters():
+    _counters.db_round_trips = 0
+    _counters.llm_calls = 0
+
+
+class _CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, *args, **kwargs):
+        _count("db_round_trips")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        _count("db_round_trips")
+        return self._cursor.executemany(*args, **kwargs)
+
+
+class _CountingConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        _count("db_round_trips")
+        return self._conn.commit()
+
+    def rollback(self):
+        _count("db_round_trips")
+        return self._conn.rollback()
+
+
+def _install_db_counters():
+    get_connection = foodiespot_db.get_connection
+
+    def counting_get_connection(readonly=False):
+        conn = get_connection(readonly)
+        return _CountingConnection(conn) if conn is not None else None
+
+    foodiespot_db.get_connection = counting_get_connection
+
+
+class MockGenerativeModel:
+    """Deterministic local stand-in for genai.GenerativeModel with configurable latency and canned function calls."""
+
+    def __init__(self, latency_ms=300, jitter_ms=100, canned_calls=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # user message -> {"name": ..., "args": {...}}; read at call time so conversations can register calls
+        self.canned_calls = canned_calls if canned_calls is not None else {}
+        self._lock = threading.Lock()
+
+    def _response(self, text=None, function_call=None, prompt=""):
+        part = SimpleNamespace(function_call=function_call, text=text)
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+            usage_metadata=SimpleNamespace(prompt_token_count=len(prompt) // 4 + 1),
+        )
+
+    def generate_content(self, prompt, tools=None, request_options=None, **kwargs):
+        _count("llm_calls")
+        seed = zlib.crc32(prompt.encode("utf-8"))
+        delay = self.latency_ms + random.Random(seed).uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(delay, 0) / 1000)
+
+        if tools:
+            # The current message follows the last "User:"; earlier ones belong to the chat history
+            user_message = prompt.rsplit("\nUser: ", 1)[-1].rsplit("\nAgent:", 1)[0].strip()
+            with self._lock:
+                call = self.canned_calls.get(user_message)
+            if call:
+                return self._response(function_call=SimpleNamespace(name=call["name"], args=call["args"]), prompt=prompt)
+            return self._response(text="Could you share a few more details so I can help?", prompt=prompt)
+
+        if "translates natural language questions into SQL" in prompt:
+            if "how many" in prompt.lower():
+                return self._response(text="SELECT cuisine, COUNT(*) FROM restaurants GROUP BY cuisine", prompt=prompt)
+            return self._response(text="SELECT name, cuisine, rating, address FROM restaurants ORDER BY rating DESC LIMIT 10", prompt=prompt)
+
+        return self._response(text="Here is what I found for you.", prompt=prompt)
+
+
+def _restaurant_names():
+    results = foodiespot_db.execute_sql_query("SELECT name FROM restaurants ORDER BY restaurant_id LIMIT 20")
+    if not isinstance(results, list) or not results:
+        raise SystemExit(f"Could not read restaurants from the database: {results}")
+    return [row[0] for row in results]
+
+
+def synthetic_conversations(count, seed=0):
+    """Builds multi-turn conversations covering recommendations, analytics and the full booking lifecycle."""
+    rng = random.Random(seed)
+    restaurants = _restaurant_names()
+    booking_date = (date.today() + timedelta(days=1)).strftime("%d-%m-%Y")
+    cuisines = ["Italian", "Chinese", "Indian", "Mexican", "Japanese"]
+    conversations = []
+    for i in range(count):
+        customer = f"loadtest-{seed}-{i}"
+        restaurant = rng.choice(restaurants)
+        cuisine = rng.choice(cuisines)
+        conversations.append({"name": f"synthetic-{i}", "turns": [
+            {"user": f"Can you recommend a good {cuisine} restaurant?"},
+            {"user": f"How many {cuisine} restaurants are there?"},
+            {"user": f"Please book a table at {restaurant} for {customer}",
+             "function_call": {"name": "make_reservation", "args": {
+                 "restaurant_name": restaurant, "date": booking_date, "time": "19:00",
+                 "party_size": rng.randint(1, 4), "customer_name": customer}}},
+            {"user": f"Show my reservations for {customer}",
+             "function_call": {"name": "list_my_reservations", "args": {"customer_name": customer}}},
+            {"user": "Change my reservation to 3 people",
+             "function_call": {"name": "modify_reservation", "args": {
+                 "reservation_id": "$last_reservation_id", "new_party_size": 3}}},
+            {"user": "Show the details of my reservation",
+             "function_call": {"name": "get_reservation_details", "args": {"reservation_id": "$last_reservation_id"}}},
+            {"user": "Please cancel my reservation",
+             "function_call": {"name": "cancel_reservation", "args": {"reservation_id": "$last_reservation_id"}}},
+        ]})
+    return conversations
+
+
+def load_conversations(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _resolve_args(args, state):
+    return {key: state.get(value[1:], value) if isinstance(value, str) and value.startswith("$") else value
+            for key, value in args.items()}
+
+
+def run_conversation(conversation, model, user_id):
+    """Plays one conversation through run_agent and returns a sample per turn."""
+    samples = []
+    chat_history = ""
+    state = {}
+    for turn in conversation["turns"]:
+        # Tag the message per virtual user so canned calls from concurrent users never collide;
+        # run_load plays each user's conversations one after another on a single thread
+        user_message = f"{turn['user']} [vu{user_id}]"
+        if turn.get("function_call"):
+            call = turn["function_call"]
+            with model._lock:
+                model.canned_calls[user_message] = {"name": call["name"], "args": _resolve_args(call["args"], state)}
+
+        _reset_counters()
+        start = time.monotonic()
+        error = None
+        try:
+            with foodiespot_db.db_session(f"vu{user_id}"):
+                response = run_agent(user_message, chat_history)
+            if isinstance(response, dict) and "error" in response:
+                error = response["error"]
+        except Exception as e:
+            response = None
+            error = str(e)
+        latency = time.monotonic() - start
+
+        if isinstance(response, dict) and "reservation_id" in response:
+            state["last_reservation_id"] = response["reservation_id"]
+        chat_history += f"User: {user_message}\nAgent: {response}\n"
+        samples.append({
+            "intent": determine_intent(turn["user"]),
+            "latency": latency,
+            "db_round_trips": getattr(_counters, "db_round_trips", 0),
+            "llm_calls": getattr(_counters, "llm_calls", 0),
+            "error": error,
+        })
+    return samples
+
+
+def print_report(samples, wall):
+    print(f"{len(samples)} turns in {wall:.2f}s, throughput {len(samples) / wall:.1f} turns/s")
+    print(f"{'intent':<26}{'turns':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'db/turn':>9}{'llm/turn':>9}{'errors':>8}")
+    groups = {"ALL": samples}
+    for sample in samples:
+        groups.setdefault(sample["intent"], []).append(sample)
+    for intent, group in groups.items():
+        latencies = [s["latency"] * 1000 for s in group]
+        print(f"{intent:<26}{len(group):>7}"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}"
+              f"{sum(s['db_round_trips'] for s in group) / len(group):>9.2f}"
+              f"{sum(s['llm_calls'] for s in group) / len(group):>9.2f}"
+              f"{sum(1 for s in group if s['error']):>8}")
+    stats = foodiespot_llm.get_llm_stats()
+    print(f"LLM gateway: {stats['calls']} provider calls, {stats['coalesced']} coalesced, "
+          f"{stats['rejected']} rejected, peak queue {stats['peak_queue_depth']}, breaker {stats['breaker_state']}")
+
+
+def run_virtual_user(conversations, model, user_id):
+    """Plays a virtual user's conversations in order, like a real user would, and returns all their samples."""
+    samples = []
+    for conversation in conversations:
+        samples.extend(run_conversation(conversation, model, user_id))
+    return samples
+
+
+def run_load(conversations, users, iterations, model):
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(pool.map(
+            lambda user_id: run_virtual_user(conversations[user_id::users] * iterations, model, user_id),
+            range(users),
+        ))
+    wall = time.monotonic() - start
+    print_report([sample for samples in results for sample in samples], wall)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodieSpot conversation replay load generator (mock LLM, local database)")
+    parser.add_argument("--conversations", help="JSONL file of recorded conversations; synthetic ones are generated otherwise")
+    parser.add_argument("--synthetic", type=int, default=20, help="Number of synthetic conversations to generate")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=1, help="Times each user replays its conversations")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-rate", type=float, default=None, help="Override the gateway rate limit (calls/s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modify-stress", type=int, metavar="WORKERS", help="Run the concurrent modify_reservation check from foodiespot_stress instead")
+    parser.add_argument("--modify-rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    _install_db_counters()
+    if args.modify_stress:
+        raise SystemExit(0 if run_modify_stress(args.modify_stress, args.modify_rounds) else 1)
+
+    if args.llm_rate:
+        foodiespot_llm.RATE_PER_SEC = args.llm_rate
+        foodiespot_llm.BURST = max(foodiespot_llm.BURST, int(args.llm_rate))
+    mock_model = MockGenerativeModel(args.llm_latency_ms, args.llm_jitter_ms)
+    foodiespot_agent.model = mock_model
+
+    if args.conversations:
+        conversations = load_conversations(args.conversations)
+    else:
+        conversations = synthetic_conversations(args.synthetic, args.seed)
+    run_load(conversations, args.users, args.iterations, mock_model)
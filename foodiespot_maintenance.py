@@ -0,0 +1,250 @@
+import argparse
+from datetime import date
+
+import psycopg2
+import streamlit as st
+
+from foodiespot_db import get_connection
+
+# Scheduled upkeep for the reservations table. Reservations are stored in
+# monthly range partitions on date so queries for today and later only touch
+# the current and future partitions. Old partitions are compacted into
+# reservations_archive, and restaurants.current_booking is recomputed from
+# upcoming reservations so past bookings stop counting against capacity.
+#
+# Run daily from cron, e.g.:  0 3 * * *  python foodiespot_maintenance.py
+
+MONTHS_AHEAD = int(st.secrets.get("RESERVATION_PARTITIONS_AHEAD", 3))
+KEEP_MONTHS = int(st.secrets.get("RESERVATION_KEEP_MONTHS", 6))
+
+
+def _month_start(day, offset=0):
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f"reservations_p{month.year}{month.month:02d}"
+
+
+def _is_partitioned(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'reservations'::regclass")
+    return cursor.fetchone()[0] == "p"
+
+
+def _create_partitions(cursor, first_month, last_month):
+    month = first_month
+    while month <= last_month:
+        name = _partition_name(month)
+        bounds = (month, _month_start(month, 1))
+        cursor.execute("SELECT to_regclass(%s), to_regclass('reservations_default')", (name,))
+        exists, default = cursor.fetchone()
+        if exists:
+            month = _month_start(month, 1)
+            continue
+
+        if default is None:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF reservations FOR VALUES FROM (%s) TO (%s)", bounds)
+        else:
+            # Bookings made before this month had a partition sit in reservations_default, and
+            # the new partition cannot be attached while the default one still holds them
+            cursor.execute("LOCK TABLE reservations_default IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"CREATE TABLE {name} (LIKE reservations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(f"INSERT INTO {name} SELECT * FROM reservations_default WHERE date >= %s AND date < %s", bounds)
+            cursor.execute("DELETE FROM reservations_default WHERE date >= %s AND date < %s", bounds)
+            cursor.execute(f"ALTER TABLE reservations ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+            # The delete above released the moved IDs; claim them again now the rows are back
+            cursor.execute(f"INSERT INTO reservation_ids SELECT reservation_id FROM {name} ON CONFLICT DO NOTHING")
+        month = _month_start(month, 1)
+
+
+def _track_reservation_ids(cursor):
+    """Keeps reservation_id unique across partitions through the reservation_ids table and a trigger."""
+    cursor.execute("SELECT 1 FROM pg_trigger WHERE tgrelid = 'reservations'::regclass AND tgname = 'reservations_track_id'")
+    if cursor.fetchone():
+        return
+
+    cursor.execute("LOCK TABLE reservations IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute("CREATE TABLE IF NOT EXISTS reservation_ids (reservation_id INTEGER PRIMARY KEY)")
+    cursor.execute("INSERT INTO reservation_ids SELECT DISTINCT reservation_id FROM reservations ON CONFLICT DO NOTHING")
+    # A duplicate ID fails the INSERT with a unique violation, as it did before partitioning
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION reservations_track_id() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM reservation_ids WHERE reservation_id = OLD.reservation_id;
+                RETURN OLD;
+            END IF;
+            INSERT INTO reservation_ids (reservation_id) VALUES (NEW.reservation_id);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE TRIGGER reservations_track_id
+        AFTER INSERT OR DELETE ON reservations
+        FOR EACH ROW EXECUTE FUNCTION reservations_track_id()
+    """)
+
+
+def partition_reservations():
+    """Converts reservations into a table partitioned by month on date. Safe to run more than once."""
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        if _is_partitioned(cursor):
+            _track_reservation_ids(cursor)
+            conn.commit()
+            return None
+
+        cursor.execute("LOCK TABLE reservations IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT MIN(date) FROM reservations")
+        oldest = cursor.fetchone()[0] or date.today()
+
+        cursor.execute("ALTER TABLE reservations RENAME TO reservations_unpartitioned")
+        cursor.execute("ALTER INDEX IF EXISTS reservations_customer_date_idx RENAME TO reservations_unpartitioned_customer_date_idx")
+        cursor.execute("CREATE TABLE reservations (LIKE reservations_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (date)")
+        # The partition key has to be part of the primary key; reservation_ids keeps the ID itself unique
+        cursor.execute("ALTER TABLE reservations ADD PRIMARY KEY (reservation_id, date)")
+        # LIKE does not copy foreign keys, so carry over restaurant_id -> restaurants and any others
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = 'reservations_unpartitioned'::regclass AND contype = 'f'")
+        for name, definition in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE reservations ADD CONSTRAINT "{name}" {definition}')
+        cursor.execute("CREATE INDEX IF NOT EXISTS reservations_customer_date_idx ON reservations (lower(customer_name), date, time, reservation_id)")
+
+        _create_partitions(cursor, _month_start(oldest), _month_start(date.today(), MONTHS_AHEAD))
+        # Catches bookings beyond the pre-created months until ensure_partitions catches up
+        cursor.execute("CREATE TABLE IF NOT EXISTS reservations_default PARTITION OF reservations DEFAULT")
+        _track_reservation_ids(cursor)
+
+        cursor.execute("INSERT INTO reservations SELECT * FROM reservations_unpartitioned")
+        cursor.execute("DROP TABLE reservations_unpartitioned")
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while partitioning reservations: {e}"
+    finally:
+        conn.close()
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Creates monthly partitions from the current month through months_ahead."""
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        today = date.today()
+        _create_partitions(cursor, _month_start(today), _month_start(today, months_ahead))
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while creating reservation partitions: {e}"
+    finally:
+        conn.close()
+
+
+def archive_reservations(keep_months=KEEP_MONTHS):
+    """Moves partitions older than keep_months into reservations_archive and drops them. Returns the archived partition names."""
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        cutoff = _month_start(date.today(), -keep_months)
+        cursor.execute("CREATE TABLE IF NOT EXISTS reservations_archive (LIKE reservations INCLUDING DEFAULTS)")
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'reservations'::regclass AND c.relname ~ '^reservations_p[0-9]{6}$'
+            ORDER BY c.relname
+        """)
+        archived = []
+        for (partition,) in cursor.fetchall():
+            month = date(int(partition[-6:-2]), int(partition[-2:]), 1)
+            if _month_start(month, 1) > cutoff:
+                continue
+            cursor.execute(f"INSERT INTO reservations_archive SELECT * FROM {partition}")
+            # Dropping a partition does not fire the delete trigger, so free the archived IDs here
+            cursor.execute(f"DELETE FROM reservation_ids WHERE reservation_id IN (SELECT reservation_id FROM {partition})")
+            cursor.execute(f"ALTER TABLE reservations DETACH PARTITION {partition}")
+            cursor.execute(f"DROP TABLE {partition}")
+            archived.append(partition)
+
+        conn.commit()
+        return archived
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while archiving reservations: {e}"
+    finally:
+        conn.close()
+
+
+def rollover_bookings():
+    """Recomputes restaurants.current_booking from reservations dated today or later. Returns the number of restaurants changed."""
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        # Take the restaurant locks first so the totals below see every booking that already
+        # bumped a counter, and bookings still in flight add their party size after us.
+        cursor.execute("SELECT restaurant_id FROM restaurants ORDER BY restaurant_id FOR UPDATE")
+        cursor.execute("""
+            UPDATE restaurants res
+            SET current_booking = COALESCE(upcoming.booked, 0)
+            FROM restaurants r
+            LEFT JOIN (
+                SELECT restaurant_id, SUM(party_size) AS booked
+                FROM reservations
+                WHERE date >= CURRENT_DATE
+                GROUP BY restaurant_id
+            ) upcoming ON upcoming.restaurant_id = r.restaurant_id
+            WHERE res.restaurant_id = r.restaurant_id
+              AND res.current_booking IS DISTINCT FROM COALESCE(upcoming.booked, 0)
+        """)
+        changed = cursor.rowcount
+        conn.commit()
+        return changed
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error during booking rollover: {e}"
+    finally:
+        conn.close()
+
+
+def run_maintenance(months_ahead=MONTHS_AHEAD, keep_months=KEEP_MONTHS):
+    steps = [
+        ("partition", partition_reservations),
+        ("ensure partitions", lambda: ensure_partitions(months_ahead)),
+        ("archive", lambda: archive_reservations(keep_months)),
+        ("rollover", rollover_bookings),
+    ]
+    # Steps are independent enough that one failure should not skip the rest, above all the rollover
+    ok = True
+    for name, step in steps:
+        result = step()
+        if isinstance(result, str):
+            print(f"{name} failed: {result}")
+            ok = False
+            continue
+        print(f"{name}: {result if result is not None else 'ok'}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodieSpot reservation partitioning, archival and booking rollover")
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    parser.add_argument("--keep-months", type=int, default=KEEP_MONTHS)
+    args = parser.parse_args()
+    if not run_maintenance(args.months_ahead, args.keep_months):
+        raise SystemExit(1)
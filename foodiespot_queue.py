@@ -0,0 +1,335 @@
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import Json
+import streamlit as st
+
+from foodiespot_db import get_connection, make_reservation, cancel_reservation
+from foodiespot_llm import percentile
+
+# Queued booking mode. Instead of every session contending on the same
+# restaurants rows, bookings are appended to a durable booking_queue table and
+# a pool of worker threads claims them in batches (FOR UPDATE SKIP LOCKED),
+# locking each restaurant once per batch and applying its bookings together.
+
+BATCH_SIZE = int(st.secrets.get("BOOKING_BATCH_SIZE", 50))
+POLL_INTERVAL_SEC = float(st.secrets.get("BOOKING_POLL_INTERVAL_SEC", 0.2))
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def booking_mode():
+    """Returns 'queued' when bookings should go through the queue, otherwise 'direct'."""
+    return st.secrets.get("BOOKING_MODE", "direct")
+
+
+def ensure_booking_queue():
+    conn = get_connection()
+    if conn is None:
+        return "Database connection failed. Please check your credentials."
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS booking_queue (
+                ticket_id BIGSERIAL PRIMARY KEY,
+                restaurant_name VARCHAR NOT NULL,
+                customer_name VARCHAR NOT NULL,
+                date DATE NOT NULL,
+                time TIME NOT NULL,
+                party_size INTEGER NOT NULL,
+                status VARCHAR NOT NULL DEFAULT 'pending',
+                result JSONB,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                processed_at TIMESTAMPTZ
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS booking_queue_pending_idx ON booking_queue (ticket_id) WHERE status = 'pending'")
+        conn.commit()
+        return None
+    except psycopg2.Error as e:
+        conn.rollback()
+        return f"Database error while creating booking queue: {e}"
+    finally:
+        conn.close()
+
+
+def enqueue_reservation(restaurant_name, date, time, party_size, customer_name):
+    """Queues a reservation and returns a pending ticket immediately."""
+    try:
+        date_obj = datetime.strptime(date, "%d-%m-%Y").date()
+        time_obj = datetime.strptime(time, "%H:%M").time()
+    except (TypeError, ValueError) as e:
+        return {"error": f"Invalid date or time format: {e}"}
+
+    conn = get_connection()
+    if conn is None:
+        return {"error": "Database connection failed. Please check your credentials."}
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            "INSERT INTO booking_queue (restaurant_name, customer_name, date, time, party_size) VALUES (%s, %s, %s, %s, %s) RETURNING ticket_id",
+            (restaurant_name, customer_name, date_obj, time_obj, party_size),
+        )
+        ticket_id = cursor.fetchone()[0]
+        conn.commit()
+        _wakeup.set()
+        return {"ticket_id": ticket_id, "status": "pending", "restaurant_name": restaurant_name}
+    except psycopg2.Error as e:
+        conn.rollback()
+        return {"error": f"Database error while queueing reservation: {e}"}
+    finally:
+        conn.close()
+
+
+def get_booking_status(ticket_id):
+    conn = get_connection()
+    if conn is None:
+        return {"error": "Database connection failed. Please check your credentials."}
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT status, result FROM booking_queue WHERE ticket_id = %s", (ticket_id,))
+        row = cursor.fetchone()
+
+        if not row:
+            return {"error": "Booking ticket not found."}
+        status, result = row
+        return {"ticket_id": ticket_id, "status": status, "result": result}
+    except psycopg2.Error as e:
+        return {"error": f"Database error while checking booking status: {e}"}
+    finally:
+        conn.close()
+
+
+def _insert_reservation(cursor, restaurant_id, customer_name, date_obj, time_obj, party_size):
+    """Inserts one reservation under a savepoint so an ID collision does not abort the batch."""
+    for _ in range(3):
+        reservation_id = random.randint(10000, 99999)
+        cursor.execute("SAVEPOINT booking")
+        try:
+            cursor.execute(
+                "INSERT INTO reservations (reservation_id, restaurant_id, customer_name, date, time, party_size) VALUES (%s, %s, %s, %s, %s, %s)",
+                (reservation_id, restaurant_id, customer_name, date_obj, time_obj, party_size),
+            )
+            cursor.execute("RELEASE SAVEPOINT booking")
+            return reservation_id
+        except psycopg2.IntegrityError:
+            cursor.execute("ROLLBACK TO SAVEPOINT booking")
+    return None
+
+
+def process_batch(conn, batch_size=BATCH_SIZE):
+    """Claims up to batch_size pending bookings, applies them grouped by restaurant and returns how many were processed."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT ticket_id, restaurant_name, customer_name, date, time, party_size, date >= CURRENT_DATE
+            FROM booking_queue
+            WHERE status = 'pending'
+            ORDER BY ticket_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        tickets = cursor.fetchall()
+        if not tickets:
+            conn.commit()
+            return 0
+
+        groups = {}
+        for ticket in tickets:
+            groups.setdefault(ticket[1], []).append(ticket)
+
+        outcomes = []
+        # Lock restaurants in name order so concurrent workers never deadlock
+        for restaurant_name in sorted(groups):
+            cursor.execute("SELECT restaurant_id, seating_capacity, current_booking FROM restaurants WHERE name = %s FOR UPDATE", (restaurant_name,))
+            restaurant = cursor.fetchone()
+            if not restaurant:
+                for ticket in groups[restaurant_name]:
+                    outcomes.append(("rejected", {"error": f"Restaurant '{restaurant_name}' not found."}, ticket[0]))
+                continue
+
+            restaurant_id, capacity, current_booking = restaurant
+            booked = 0
+            for ticket_id, _, customer_name, date_obj, time_obj, party_size, upcoming in groups[restaurant_name]:
+                if current_booking + booked + party_size > capacity:
+                    outcomes.append(("rejected", {"error": f"Sorry, there are not enough spots available at {restaurant_name} on {date_obj} at {time_obj}. Would you like to check other options?"}, ticket_id))
+                    continue
+
+                reservation_id = _insert_reservation(cursor, restaurant_id, customer_name, date_obj, time_obj, party_size)
+                if reservation_id is None:
+                    outcomes.append(("rejected", {"error": "Could not allocate a reservation ID. Please try again."}, ticket_id))
+                    continue
+
+                # Only bookings dated today or later count, matching the nightly rollover
+                if upcoming:
+                    booked += party_size
+                outcomes.append(("confirmed", {
+                    "reservation_id": reservation_id,
+                    "restaurant_name": restaurant_name,
+                    "customer_name": customer_name,
+                    "date": str(date_obj),
+                    "time": str(time_obj),
+                    "party_size": party_size
+                }, ticket_id))
+
+            if booked:
+                cursor.execute("UPDATE restaurants SET current_booking = current_booking + %s WHERE restaurant_id = %s", (booked, restaurant_id))
+
+        cursor.executemany(
+            "UPDATE booking_queue SET status = %s, result = %s, processed_at = now() WHERE ticket_id = %s",
+            [(status, Json(result), ticket_id) for status, result, ticket_id in outcomes],
+        )
+        conn.commit()
+        return len(tickets)
+    except psycopg2.Error as e:
+        print(f"Database error while processing booking batch: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error as rollback_error:
+            # The connection is gone; let the worker replace it
+            raise psycopg2.InterfaceError(f"rollback failed: {rollback_error}") from e
+        return 0
+
+
+def _worker_loop(stop_event, batch_size):
+    conn = None
+    while not stop_event.is_set():
+        if conn is None or conn.closed:
+            conn = get_connection()
+            if conn is None:
+                stop_event.wait(1)
+                continue
+        try:
+            processed = process_batch(conn, batch_size)
+        except psycopg2.InterfaceError as e:
+            print(f"Booking worker lost its connection: {e}")
+            conn.close()
+            conn = None
+            continue
+        except Exception as e:
+            # close() rolls back the claimed batch so another worker can pick it up
+            print(f"Booking worker error, retrying with a fresh connection: {e}")
+            conn.close()
+            conn = None
+            stop_event.wait(1)
+            continue
+        if processed < batch_size:
+            _wakeup.wait(POLL_INTERVAL_SEC)
+            _wakeup.clear()
+    if conn is not None and not conn.closed:
+        conn.close()
+
+
+def start_booking_workers(count=None, batch_size=BATCH_SIZE):
+    """Starts the booking worker threads once per process and returns the event that stops them."""
+    with _workers_lock:
+        if _workers:
+            return _workers[0][1]
+        count = count or int(st.secrets.get("BOOKING_WORKERS", 4))
+        stop_event = threading.Event()
+        for i in range(count):
+            thread = threading.Thread(target=_worker_loop, args=(stop_event, batch_size), name=f"booking-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append((thread, stop_event))
+        return stop_event
+
+
+def stop_booking_workers():
+    with _workers_lock:
+        for thread, stop_event in _workers:
+            stop_event.set()
+        _wakeup.set()
+        for thread, _ in _workers:
+            thread.join()
+        _workers.clear()
+
+
+def _wait_for_ticket(ticket_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = get_booking_status(ticket_id)
+        if status.get("status") != "pending":
+            return status
+        time.sleep(0.05)
+    return {"ticket_id": ticket_id, "status": "timeout"}
+
+
+def run_benchmark(restaurant_name, bookings, concurrency, date, time_slot):
+    """Books the same restaurant through the direct and queued paths and prints throughput and latency percentiles."""
+
+    def direct(i):
+        start = time.monotonic()
+        result = make_reservation(restaurant_name, date, time_slot, 1, f"bench-direct-{i}")
+        return time.monotonic() - start, result.get("reservation_id")
+
+    def queued(i):
+        start = time.monotonic()
+        ticket = enqueue_reservation(restaurant_name, date, time_slot, 1, f"bench-queued-{i}")
+        if "error" in ticket:
+            return time.monotonic() - start, None
+        enqueued = time.monotonic() - start
+        status = _wait_for_ticket(ticket["ticket_id"])
+        result = status.get("result") or {}
+        return enqueued, time.monotonic() - start, result.get("reservation_id")
+
+    ensure_booking_queue()
+    start_booking_workers()
+
+    for mode, fn in (("direct", direct), ("queued", queued)):
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fn, range(bookings)))
+        wall = time.monotonic() - start
+
+        reservation_ids = [r[-1] for r in results if r[-1] is not None]
+        print(f"{mode}: {bookings} bookings in {wall:.2f}s ({bookings / wall:.1f}/s), {len(reservation_ids)} confirmed")
+        if mode == "queued":
+            acks = [r[0] for r in results]
+            print(f"  ticket ack  p50={percentile(acks, 50) * 1000:.1f}ms p95={percentile(acks, 95) * 1000:.1f}ms p99={percentile(acks, 99) * 1000:.1f}ms")
+        latencies = [r[-2] for r in results]
+        print(f"  confirmed   p50={percentile(latencies, 50) * 1000:.1f}ms p95={percentile(latencies, 95) * 1000:.1f}ms p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+        for reservation_id in reservation_ids:
+            cancel_reservation(reservation_id)
+
+    stop_booking_workers()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodieSpot queued booking workers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = subparsers.add_parser("worker", help="Run booking workers until interrupted")
+    worker_parser.add_argument("--workers", type=int, default=None)
+    worker_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    bench_parser = subparsers.add_parser("bench", help="Compare direct and queued booking against a test database")
+    bench_parser.add_argument("--restaurant", required=True)
+    bench_parser.add_argument("--bookings", type=int, default=200)
+    bench_parser.add_argument("--concurrency", type=int, default=20)
+    bench_parser.add_argument("--date", default=datetime.now().strftime("%d-%m-%Y"))
+    bench_parser.add_argument("--time", default="19:00")
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        error = ensure_booking_queue()
+        if error:
+            raise SystemExit(error)
+        stop_event = start_booking_workers(args.workers, args.batch_size)
+        try:
+            while not stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            stop_booking_workers()
+    else:
+        run_benchmark(args.restaurant, args.bookings, args.concurrency, args.date, args.time)
@@ -0,0 +1,148 @@
+import csv
+import io
+import re
+from decimal import Decimal
+
+from psycopg2 import sql
+import streamlit as st
+
+# Encodes query results for LLM interpretation prompts. Rows are capped in SQL,
+# ID and constant columns are dropped, the rest is written as CSV with a header
+# until the token budget runs out, and anything left over is summarized.
+
+PROMPT_TOKEN_BUDGET = int(st.secrets.get("PROMPT_RESULT_TOKEN_BUDGET", 1500))
+MAX_RESULT_ROWS = int(st.secrets.get("PROMPT_MAX_RESULT_ROWS", 200))
+MAX_VALUE_CHARS = 80
+
+
+def estimate_tokens(text):
+    """Rough token count for Gemini-style tokenizers (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def limit_query(query, max_rows=MAX_RESULT_ROWS):
+    """Wraps a SELECT so the database returns at most max_rows + 1 rows; the extra row signals overflow."""
+    return f"SELECT * FROM ({query.strip().rstrip(';')}) AS limited_result LIMIT {int(max_rows) + 1}"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def numeric_columns(columns, rows):
+    """Returns the columns whose non-null values are all numbers."""
+    numeric = []
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows if row[index] is not None]
+        if values and all(_is_number(value) for value in values):
+            numeric.append(column)
+    return numeric
+
+
+def summary_query(query, numeric_columns):
+    """Builds a query returning the full row count and min/max/avg of each numeric column of query."""
+    fields = [sql.SQL("COUNT(*)")]
+    for column in numeric_columns:
+        identifier = sql.Identifier(column)
+        fields.extend([
+            sql.SQL("MIN({})").format(identifier),
+            sql.SQL("MAX({})").format(identifier),
+            sql.SQL("AVG({})").format(identifier),
+        ])
+    return sql.SQL("SELECT {} FROM ({}) AS full_result").format(
+        sql.SQL(", ").join(fields),
+        sql.SQL(query.strip().rstrip(";")),
+    )
+
+
+def project_columns(columns, rows, question):
+    """Drops ID columns the question does not ask about and columns that are constant across rows."""
+    asks_for_ids = "id" in re.findall(r"\w+", question.lower())
+    keep = []
+    constants = []
+    for index, column in enumerate(columns):
+        if column.endswith("_id") and not asks_for_ids:
+            continue
+        values = {repr(row[index]) for row in rows}
+        if len(rows) > 1 and len(values) == 1:
+            constants.append(f"{column}: {rows[0][index]} (same for every row)")
+            continue
+        keep.append(index)
+    if not keep:
+        keep = list(range(len(columns)))
+        constants = []
+    return [columns[i] for i in keep], [tuple(row[i] for i in keep) for row in rows], constants
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        value = round(value, 2)
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + "..."
+
+
+def _aggregates(columns, rows):
+    aggregates = {}
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows if _is_number(row[index])]
+        if values:
+            aggregates[column] = (min(values), max(values), sum(values) / len(values))
+    return aggregates
+
+
+def _summary_line(shown, total_rows, aggregate_parts, at_least=False):
+    total = f"at least {total_rows}" if at_least else total_rows
+    return f"# {'; '.join([f'showing {shown} of {total} rows'] + aggregate_parts)}\n"
+
+
+def encode_results(columns, rows, question, total_rows=None, aggregates=None, token_budget=PROMPT_TOKEN_BUDGET, total_is_lower_bound=False):
+    """Encodes rows as compact CSV within token_budget; returns (text, info). Set total_is_lower_bound when total_rows is only a minimum."""
+    total_rows = len(rows) if total_rows is None else total_rows
+    tuple_repr_tokens = estimate_tokens("\n".join(str(row) for row in rows))
+    columns, rows, constants = project_columns(columns, rows, question)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for note in constants:
+        buffer.write(f"# {note}\n")
+    writer.writerow(columns)
+
+    if aggregates is None:
+        aggregates = _aggregates(columns, rows)
+    aggregate_parts = [
+        f"{column} min {_format_value(low)}, max {_format_value(high)}, avg {_format_value(float(mean))}"
+        for column, (low, high, mean) in aggregates.items()
+        if column in columns and mean is not None
+    ]
+    if total_is_lower_bound and aggregate_parts:
+        # The full result could not be summarized, so these only describe the rows we fetched
+        aggregate_parts[0] = f"over the first {len(rows)} rows: {aggregate_parts[0]}"
+    # Reserve the summary's real size (shown never has more digits than total_rows), dropping
+    # aggregates while the header and summary alone would not fit
+    while aggregate_parts and estimate_tokens(buffer.getvalue() + _summary_line(total_rows, total_rows, aggregate_parts, total_is_lower_bound)) > token_budget:
+        aggregate_parts.pop()
+    reserve = _summary_line(total_rows, total_rows, aggregate_parts, total_is_lower_bound)
+
+    shown = 0
+    for row in rows:
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow([_format_value(value) for value in row])
+        if estimate_tokens(buffer.getvalue() + line.getvalue() + reserve) > token_budget and shown > 0:
+            break
+        buffer.write(line.getvalue())
+        shown += 1
+
+    if shown < total_rows:
+        buffer.write(_summary_line(shown, total_rows, aggregate_parts, total_is_lower_bound))
+
+    text = buffer.getvalue()
+    info = {
+        "rows_total": total_rows,
+        "rows_total_is_lower_bound": total_is_lower_bound,
+        "rows_shown": shown,
+        "prompt_tokens": estimate_tokens(text),
+        "tuple_repr_tokens": tuple_repr_tokens,
+    }
+    return text, info
@@ -1,8 +1,12 @@
 import streamlit as st
 from foodiespot_agent import run_agent
-from foodiespot_db import get_connection
-import time
+from foodiespot_db import get_connection, ensure_reservation_indexes, set_db_session
+from foodiespot_queue import booking_mode, ensure_booking_queue, start_booking_workers, get_booking_status
 import random
+import uuid
+
+# Number of transcript messages shown per page of chat history
+CHAT_PAGE_SIZE = 20
 
 # Page configuration
 st.set_page_config(
@@ -12,6 +16,33 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Tag this run with the browser session so reads right after a booking see it
+if "db_session" not in st.session_state:
+    st.session_state.db_session = uuid.uuid4().hex
+set_db_session(st.session_state.db_session)
+
+# Create lookup indexes once per process
+@st.cache_resource
+def init_reservation_indexes():
+    error = ensure_reservation_indexes()
+    if error:
+        print(error)
+    return True
+
+init_reservation_indexes()
+
+# Queued booking mode: create the queue table and start workers once per process
+@st.cache_resource
+def init_booking_queue():
+    error = ensure_booking_queue()
+    if error:
+        print(error)
+    start_booking_workers()
+    return True
+
+if booking_mode() == "queued":
+    init_booking_queue()
+
 # Load CSS
 def local_css(file_name):
     with open(file_name) as f:
@@ -34,6 +65,36 @@ def render_header():
         unsafe_allow_html=True
     )
 
+# Renders one transcript entry
+def render_message(message):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+
+# Turns an agent response into the markdown stored in the transcript
+def format_response(full_response):
+    if isinstance(full_response, str):  # Handle string responses
+        return full_response
+    elif isinstance(full_response, dict):  # Handle dictionary responses
+        if 'error' in full_response:
+            return f"Error: {full_response['error']}"
+        elif 'ticket_id' in full_response:
+            return f"Your booking at {full_response.get('restaurant_name')} is queued (ticket {full_response['ticket_id']}). I'll confirm here as soon as it's processed."
+        elif 'message' in full_response:
+            return full_response['message']
+        return f"""
+        **Reservation Details:**
+        - Reservation ID: {full_response.get('reservation_id')}
+        - Restaurant: {full_response.get('restaurant_name')}
+        - Customer: {full_response.get('customer_name')}
+        - Date: {full_response.get('date')}
+        - Time: {full_response.get('time')}
+        - Party Size: {full_response.get('party_size')}
+        """
+    elif full_response is None:  # Handle None response
+        return "Reservation not found."
+    else:  # handle unexpected response.
+        return "An unexpected error occurred."
+
 # Sidebar with animation
 st.sidebar.markdown('<div class="sidebar-header">🍔 FoodieSpot</div>', unsafe_allow_html=True)
 st.sidebar.markdown('---')
@@ -60,28 +121,90 @@ if page == "💬 Chat with Assistant":
         welcome_message = "👋 Hello! I'm your FoodieSpot assistant. I can help you find restaurants, make reservations, or answer questions about cuisines. How can I assist you today?"
         st.session_state.messages.append({"role": "assistant", "content": welcome_message})
 
-    # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    # Older history is paginated: a full page run shows the latest CHAT_PAGE_SIZE messages and
+    # "Show earlier messages" extends the window
+    st.session_state.setdefault("chat_window", CHAT_PAGE_SIZE)
+    st.session_state.rendered_upto = len(st.session_state.messages)
+    show_from = max(0, st.session_state.rendered_upto - st.session_state.chat_window)
+    if show_from > 0 and st.button(f"Show earlier messages ({show_from} more)"):
+        st.session_state.chat_window += CHAT_PAGE_SIZE
+        show_from = max(0, st.session_state.rendered_upto - st.session_state.chat_window)
 
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    # Chat input with custom styling
-    prompt = st.chat_input("What would you like to know about restaurants?")
+    for message in st.session_state.messages[show_from:st.session_state.rendered_upto]:
+        render_message(message)
 
-    if prompt:
-        # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": prompt})
+    st.markdown('</div>', unsafe_allow_html=True)
 
-        # Rerun to display user message
-        st.rerun()
+    # Poll queued bookings and post the outcome once the worker resolves them
+    @st.fragment(run_every=2)
+    def pending_bookings():
+        for ticket_id in list(st.session_state.get("pending_tickets", [])):
+            status = get_booking_status(ticket_id)
+            if status.get("status") == "pending":
+                st.info(f"⏳ Booking ticket {ticket_id} is being processed...")
+                continue
+            st.session_state.pending_tickets.remove(ticket_id)
+            result = status.get("result") or {}
+            if status.get("status") == "confirmed":
+                content = f"""
+                **Reservation Confirmed!**
+                - Reservation ID: {result.get('reservation_id')}
+                - Restaurant: {result.get('restaurant_name')}
+                - Customer: {result.get('customer_name')}
+                - Date: {result.get('date')}
+                - Time: {result.get('time')}
+                - Party Size: {result.get('party_size')}
+                """
+            else:
+                content = f"Booking ticket {ticket_id} could not be completed: {result.get('error', status.get('error'))}"
+            st.session_state.messages.append({"role": "assistant", "content": content})
+            st.rerun()
+
+    if st.session_state.get("pending_tickets"):
+        pending_bookings()
+
+    # New turns run inside a fragment, so a prompt reruns only this block and renders only the
+    # messages added since the last full page run
+    @st.fragment
+    def chat_turns():
+        # Fragment reruns skip the top of the script, so tag the DB session here as well
+        set_db_session(st.session_state.db_session)
+        new_messages = st.session_state.messages[st.session_state.rendered_upto:]
+        if len(new_messages) > CHAT_PAGE_SIZE:
+            # Fold the live turns back into the paginated history
+            st.rerun()
+        for message in new_messages:
+            render_message(message)
+
+        prompt = st.chat_input("What would you like to know about restaurants?")
+        if not prompt:
+            return
+
+        user_message = {"role": "user", "content": prompt}
+        st.session_state.messages.append(user_message)
+        render_message(user_message)
+
+        with st.chat_message("assistant"):
+            with st.spinner("Thinking..."):
+                full_response = run_agent(prompt, st.session_state.chat_history)
+            if isinstance(full_response, dict) and 'ticket_id' in full_response:
+                st.session_state.setdefault("pending_tickets", []).append(full_response['ticket_id'])
+            content = format_response(full_response)
+            st.markdown(content)
+
+        st.session_state.chat_history += f"User: {prompt}\nAgent: {full_response}\n"
+        st.session_state.messages.append({"role": "assistant", "content": content})
+        if st.session_state.get("pending_tickets"):
+            # Start polling the new ticket
+            st.rerun()
+
+    chat_turns()
 
 elif page == "🍽️ Top Restaurants":
     render_header()
     st.markdown("<h2>Top-Rated Restaurants</h2>", unsafe_allow_html=True)
 
-    conn = get_connection()
+    conn = get_connection(readonly=True)
     if conn:
         cursor = conn.cursor()
         try:
@@ -182,48 +305,6 @@ elif page == "ℹ️ About":
     """, unsafe_allow_html=True)
 
 
-# Callback for handling messages in chat page
-def animated_loading():
-    def animated_loading():
-        with st.spinner('Thinking...'):
-            time.sleep(1.5)
-
-
-# Use in the chat response section:
-if page == "💬 Chat with Assistant" and len(st.session_state.messages) > 0 and st.session_state.messages[-1]["role"] == "user":
-
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
-        animated_loading()  # Add visual feedback
-        user_message = st.session_state.messages[-1]["content"]
-        full_response = run_agent(user_message, st.session_state.chat_history)
-
-        if isinstance(full_response, str):  # Handle string responses
-            message_placeholder.markdown(full_response)
-        elif isinstance(full_response, dict):  # Handle dictionary responses
-            if 'error' in full_response:
-                message_placeholder.markdown(f"Error: {full_response['error']}")
-            else:
-                details = f"""
-                **Reservation Details:**
-                - Reservation ID: {full_response.get('reservation_id')}
-                - Restaurant: {full_response.get('restaurant_name')}
-                - Customer: {full_response.get('customer_name')}
-                - Date: {full_response.get('date')}
-                - Time: {full_response.get('time')}
-                - Party Size: {full_response.get('party_size')}
-                """
-                message_placeholder.markdown(details)
-        elif full_response is None:  # Handle None response
-            message_placeholder.markdown("Reservation not found.")
-        else:  # handle unexpected response.
-            message_placeholder.markdown("An unexpected error occurred.")
-
-        st.session_state.chat_history += f"User: {user_message}\nAgent: {full_response}\n"
-        st.session_state.messages.append(
-            {"role": "assistant",
-             "content": message_placeholder.markdown(details) if isinstance(full_response, dict) and 'error' not in full_response else full_response})
-
 # Add footer
 st.markdown("""
 <footer>
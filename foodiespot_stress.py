@@ -0,0 +1,90 @@
+import argparse
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import foodiespot_db
+
+# Concurrency checks for the reservation write paths. Many threads modify the
+# same reservation at once; afterwards restaurants.current_booking must have
+# moved by exactly the difference between the original and final party size.
+#
+#   python foodiespot_stress.py --workers 16 --rounds 20
+
+
+def _read_primary(query, params):
+    # Lookups here go to the primary: a lagging replica would report stale values
+    conn = foodiespot_db.get_connection()
+    if conn is None:
+        raise SystemExit("Database connection failed. Please check your credentials.")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    if not row:
+        raise SystemExit(f"No row found for {params}.")
+    return row[0]
+
+
+def _current_booking(restaurant_name):
+    return _read_primary("SELECT current_booking FROM restaurants WHERE name = %s", (restaurant_name,))
+
+
+def run_modify_stress(workers, rounds, restaurant_name=None):
+    """Modifies one reservation concurrently and checks that current_booking moved by exactly the party size delta."""
+    if restaurant_name is None:
+        results = foodiespot_db.execute_sql_query("SELECT name FROM restaurants ORDER BY restaurant_id LIMIT 1")
+        if not isinstance(results, list) or not results:
+            raise SystemExit(f"Could not read restaurants from the database: {results}")
+        restaurant_name = results[0][0]
+
+    booking_date = (date.today() + timedelta(days=1)).strftime("%d-%m-%Y")
+    reservation = foodiespot_db.make_reservation(restaurant_name, booking_date, "19:00", 2, "stress-modify")
+    if "error" in reservation:
+        raise SystemExit(f"Could not create the stress reservation: {reservation['error']}")
+    reservation_id = reservation["reservation_id"]
+    before = _current_booking(restaurant_name)
+
+    def modify(worker):
+        rng = random.Random(worker)
+        successes = 0
+        errors = Counter()
+        for _ in range(rounds):
+            result = foodiespot_db.modify_reservation(reservation_id, new_party_size=rng.randint(1, 6))
+            if "error" in result:
+                # Group by the message before any driver detail, e.g. "Database error during modification"
+                errors[result["error"].split(":", 1)[0]] += 1
+            else:
+                successes += 1
+        return successes, errors
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(modify, range(workers)))
+    successes = sum(worker_successes for worker_successes, _ in outcomes)
+    errors = sum((worker_errors for _, worker_errors in outcomes), Counter())
+
+    final_party_size = _read_primary("SELECT party_size FROM reservations WHERE reservation_id = %s", (reservation_id,))
+    after = _current_booking(restaurant_name)
+    foodiespot_db.cancel_reservation(reservation_id)
+
+    expected = before - 2 + final_party_size
+    # A run where nothing was modified proves nothing about the counter, so it fails too
+    ok = after == expected and successes > 0
+    status = "OK" if ok else ("MISMATCH" if after != expected else "NO SUCCESSFUL MODIFICATIONS")
+    print(f"modify stress: {workers} workers x {rounds} rounds, {successes} succeeded, {sum(errors.values())} failed, "
+          f"final party size {final_party_size}, current_booking {before} -> {after} (expected {expected}): {status}")
+    for error, count in errors.most_common():
+        print(f"  {count:>6}  {error}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodieSpot concurrent reservation modification check (run against a test database)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--restaurant", help="Restaurant to book; defaults to the first one")
+    args = parser.parse_args()
+    if not run_modify_stress(args.workers, args.rounds, args.restaurant):
+        raise SystemExit(1)